@@ -0,0 +1,253 @@
+# License: BSD (3-clause)
+
+'''
+Benchmarks of the main loading and computation paths, on the synthetic
+files of lexvars.synthetic (or on the real corpora, if they are laid out
+the same way):
+
+python -m lexvars.benchmark /tmp/fixtures --generate --json today.json
+python -m lexvars.benchmark /tmp/fixtures --compare today.json
+
+Each benchmark runs in a fresh process with an empty cache directory of
+its own, so that its peak resident memory is measured on its own and
+caches built by one benchmark don't speed up another; benchmarks that time
+cached loads fill their cache first. Lexicons that a benchmark loads
+before timing its operations (e.g. the CELEX tables for old20) are parsed
+into that cache, outside the timings. A benchmark times a number of
+operations (reading one database, one call of a function, ...), each of
+which handles a number of items (rows, words, files, tokens); the report
+gives the throughput in items per second, the median, 90th and 99th
+percentile time per operation, and the peak RSS of the process.
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from celex import Celex
+from synthetic import write_bnc, write_celex, write_valex
+
+
+def _timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return time.time() - start, result
+
+
+def bench_celex_read_db(fixtures, cache_dir):
+    clx = Celex(os.path.join(fixtures, 'celex'), use_cache=False)
+    timings = []
+    for db in clx.lemma_dbs() + clx.wordform_dbs():
+        seconds, records = _timed(clx.read_db, db)
+        timings.append((seconds, len(records)))
+    return timings
+
+
+def bench_celex_load(fixtures, cache_dir):
+    # Parsing all of the DBs and joining them, without the cache
+    clx = Celex(os.path.join(fixtures, 'celex'), use_cache=False)
+    seconds, _ = _timed(clx.load_lemmas)
+    timings = [(seconds, len(clx._lemmas))]
+    seconds, _ = _timed(clx.load_wordforms)
+    return timings + [(seconds, len(clx._wordforms))]
+
+
+def bench_celex_load_cached(fixtures, cache_dir):
+    # Fill the cache, then time loads from it
+    Celex(os.path.join(fixtures, 'celex'), cache_dir=cache_dir).load_lemmas()
+    timings = []
+    for i in range(5):
+        clx = Celex(os.path.join(fixtures, 'celex'), cache_dir=cache_dir)
+        seconds, _ = _timed(clx.load_lemmas)
+        timings.append((seconds, len(clx._lemmas)))
+    return timings
+
+
+def _lexvars(fixtures, cache_dir):
+    from lexvars import LexVars
+    clx = Celex(os.path.join(fixtures, 'celex'), cache_dir=cache_dir)
+    lv = LexVars(clx)
+    words = sorted(set(clx.lemma_column('Head')))
+    return lv, words
+
+
+def bench_inflectional_entropy(fixtures, cache_dir):
+    lv, words = _lexvars(fixtures, cache_dir)
+    lv.inflectional_entropy(words[0])
+    step = max(1, len(words) // 2000)
+    return [(_timed(lv.inflectional_entropy, word)[0], 1)
+            for word in words[::step]]
+
+
+def bench_inflectional_entropies(fixtures, cache_dir):
+    lv, words = _lexvars(fixtures, cache_dir)
+    lv.inflectional_entropies(words[:1])
+    return [(_timed(lv.inflectional_entropies, words[i:i + 1000])[0],
+             len(words[i:i + 1000]))
+            for i in range(0, len(words), 1000)]
+
+
+def bench_old20(fixtures, cache_dir):
+    lv, words = _lexvars(fixtures, cache_dir)
+    lv.old20(words[0])
+    step = max(1, len(words) // 500)
+    return [(_timed(lv.old20, word)[0], 1) for word in words[::step]]
+
+
+def bench_valex_read_lex_file(fixtures, cache_dir):
+    from valex import Valex
+    path = os.path.join(fixtures, 'valex')
+    vlx = Valex(path)
+    timings = []
+    for filename in sorted(os.listdir(path)):
+        seconds, frames = _timed(vlx.read_lex_file,
+                                 os.path.join(path, filename))
+        timings.append((seconds, 1))
+    return timings
+
+
+def bench_subcat_top_k(fixtures, cache_dir):
+    from valex import Valex
+    vlx = Valex(os.path.join(fixtures, 'valex'), cache_dir=cache_dir)
+    vlx.load_all_verbs(progress=False)
+    timings = []
+    for metric in ['js', 'hellinger', 'cosine']:
+        index = vlx.similarity_index(metric)
+        timings.append((_timed(index.top_k, 10)[0], len(index)))
+    return timings
+
+
+def bench_bnc_read_file(fixtures, cache_dir):
+    # Requires NLTK and its WordNet and stopwords data. BNCWordVecs.read_all
+    # is a loop over read_file (plus process, which needs the context words
+    # chosen from an earlier pass), so each file is timed as an operation
+    # of its own to get the percentiles per file
+    from bnc_word_vecs import BNCWordVecs
+    bnc = BNCWordVecs(os.path.join(fixtures, 'bnc'))
+    timings = []
+    for filename in bnc.all_files():
+        before = bnc.total_n_words
+        seconds, _ = _timed(bnc.read_file, filename)
+        timings.append((seconds, bnc.total_n_words - before))
+    return timings
+
+
+benchmarks = [
+    ('celex_read_db', bench_celex_read_db, 'rows'),
+    ('celex_load', bench_celex_load, 'rows'),
+    ('celex_load_cached', bench_celex_load_cached, 'rows'),
+    ('inflectional_entropy', bench_inflectional_entropy, 'words'),
+    ('inflectional_entropies', bench_inflectional_entropies, 'words'),
+    ('old20', bench_old20, 'words'),
+    ('valex_read_lex_file', bench_valex_read_lex_file, 'files'),
+    ('subcat_top_k', bench_subcat_top_k, 'verbs'),
+    ('bnc_read_file', bench_bnc_read_file, 'tokens'),
+]
+
+
+def _run_job(args):
+    name, fixtures = args
+    function = dict((x[0], x[1]) for x in benchmarks)[name]
+    cache_dir = tempfile.mkdtemp(prefix='lexvars-benchmark-')
+    try:
+        timings = function(fixtures, cache_dir)
+    except (ImportError, LookupError) as e:
+        # A missing optional dependency, or missing NLTK data
+        return {'skipped': str(e)}
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    seconds = np.array([t for t, n in timings])
+    items = sum(n for t, n in timings)
+    return {'operations': len(timings), 'items': items,
+            'seconds': seconds.sum(),
+            'throughput': items / seconds.sum() if seconds.sum() > 0 else None,
+            'p50_ms': np.percentile(seconds, 50) * 1000,
+            'p90_ms': np.percentile(seconds, 90) * 1000,
+            'p99_ms': np.percentile(seconds, 99) * 1000,
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_mb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024.}
+
+
+def run(fixtures, names=None):
+    '''
+    Runs the benchmarks (all of them, or those in names) on the files in
+    the fixtures directory, and returns a dictionary from each name to its
+    results
+    '''
+    results = {}
+    for name, function, unit in benchmarks:
+        if names is not None and name not in names:
+            continue
+        pool = multiprocessing.Pool(1)
+        try:
+            results[name] = pool.apply(_run_job, [(name, fixtures)])
+        finally:
+            pool.terminate()
+        results[name]['unit'] = unit
+    return results
+
+
+def report(results, baseline=None, f=sys.stdout):
+    '''
+    Prints the results of run; if baseline (earlier results) is given, also
+    the ratio of the throughput to the baseline throughput
+    '''
+    print >> f, '%-24s %8s %14s %10s %10s %10s %9s%s' % (
+        'benchmark', 'ops', 'items/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'RSS MB', '  vs. baseline' if baseline else '')
+    for name, function, unit in benchmarks:
+        if name not in results:
+            continue
+        r = results[name]
+        if 'skipped' in r:
+            print >> f, '%-24s skipped (%s)' % (name, r['skipped'])
+            continue
+        ratio = ''
+        old = (baseline or {}).get(name, {}).get('throughput')
+        if old and r['throughput']:
+            ratio = '  %.2fx' % (r['throughput'] / old)
+        print >> f, '%-24s %8d %8.0f %-5s %10.3f %10.3f %10.3f %9.1f%s' % (
+            name, r['operations'], r['throughput'] or 0, unit, r['p50_ms'],
+            r['p90_ms'], r['p99_ms'], r['peak_rss_mb'], ratio)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the benchmarks')
+    parser.add_argument('fixtures', help='directory with celex, valex and '
+                        'bnc subdirectories (see lexvars.synthetic)')
+    parser.add_argument('--generate', action='store_true',
+                        help='write synthetic files into the directory first')
+    parser.add_argument('--lemmas', type=int, default=20000)
+    parser.add_argument('--verbs', type=int, default=1000)
+    parser.add_argument('--bnc-files', type=int, default=20)
+    parser.add_argument('-b', '--benchmarks',
+                        help='comma-separated names: %s' %
+                        ', '.join(x[0] for x in benchmarks))
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results saved with --json to '
+                        'compare to')
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        write_celex(os.path.join(args.fixtures, 'celex'), args.lemmas)
+        write_valex(os.path.join(args.fixtures, 'valex'), args.verbs)
+        write_bnc(os.path.join(args.fixtures, 'bnc'), args.bnc_files)
+    names = args.benchmarks.split(',') if args.benchmarks else None
+    results = run(args.fixtures, names)
+    baseline = json.load(open(args.compare)) if args.compare else None
+    report(results, baseline)
+    if args.json:
+        json.dump(results, open(args.json, 'w'), indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
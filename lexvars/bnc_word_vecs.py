@@ -1,7 +1,6 @@
 import collections
 import json
 import lxml
-import math
 import os
 import re
 import time
@@ -9,6 +8,10 @@ import time
 import nltk
 import nltk.corpus
 from nltk.corpus.reader.wordnet import NOUN, VERB, ADJ, ADV
+import numpy as np
+
+import instrument
+from entropy import kl_divergences
 
 
 class BNCWordVecs(object): 
@@ -81,45 +84,54 @@ class BNCWordVecs(object):
             self.vectors[tw] = dict((cw, 0) for cw in keys)
 
     def read_file(self, filename):
-        contents = open(filename).read()
-        words = self.word_regex.finditer(contents)
-        lemmatized = []
-
-        # remove punctuation, capitalization, and sentence/utterance 
-        # boundary information
-        for word in words:
-            self.total_n_words += 1
-            if word.group(2) is None:
-                continue
-            normalized = word.group(2).lower().strip()
-            if (normalized in self.stopwords or normalized in ['', "n't"] or
-                    normalized[0] == "'"):
-                continue
-            penn_pos = word.group(1)
-            wordnet_pos = self.pos_map.get(penn_pos[0], VERB)
-            lemma = self.lemmatizer.lemmatize(normalized, wordnet_pos)
-            lemmatized.append(lemma)
+        with instrument.phase('bnc.parse') as phase:
+            contents = open(filename).read()
+            words = self.word_regex.finditer(contents)
+            tokens = []
+
+            # remove punctuation, capitalization, and sentence/utterance 
+            # boundary information
+            n_words = self.total_n_words
+            for word in words:
+                self.total_n_words += 1
+                if word.group(2) is None:
+                    continue
+                normalized = word.group(2).lower().strip()
+                if (normalized in self.stopwords or
+                        normalized in ['', "n't"] or normalized[0] == "'"):
+                    continue
+                penn_pos = word.group(1)
+                wordnet_pos = self.pos_map.get(penn_pos[0], VERB)
+                tokens.append((normalized, wordnet_pos))
+            phase.add('bytes', len(contents))
+            phase.add('tokens', self.total_n_words - n_words)
+
+        with instrument.phase('bnc.lemmatize') as phase:
+            lemmatized = [self.lemmatizer.lemmatize(normalized, wordnet_pos)
+                          for normalized, wordnet_pos in tokens]
+            phase.add('tokens', len(tokens))
 
         self.frequencies.update(lemmatized)
         return lemmatized
 
     def process(self, words):
-        is_context_word = [x in self.context_words for x in words]
-        for i in range(len(words)):
-            if words[i] not in self.target_words:
-                continue
-            lower = max(0, i - self.window_size)
-            upper = min(len(words), i + self.window_size + 1)
-            for j in range(lower, i) + range(i + 1, upper):
-                if is_context_word[j]:
-                    self.vectors[words[i]][words[j]] += 1
+        with instrument.phase('bnc.matrix_update') as phase:
+            is_context_word = [x in self.context_words for x in words]
+            for i in range(len(words)):
+                if words[i] not in self.target_words:
+                    continue
+                lower = max(0, i - self.window_size)
+                upper = min(len(words), i + self.window_size + 1)
+                for j in range(lower, i) + range(i + 1, upper):
+                    if is_context_word[j]:
+                        self.vectors[words[i]][words[j]] += 1
+            phase.add('tokens', len(words))
 
     def all_files(self):
         for f1 in os.listdir(self.corpus_root):
             f1_full = os.path.join(self.corpus_root, f1)
             if os.path.isdir(f1_full):
                 for f2 in os.listdir(f1_full):
-                    print f2, self.total_n_words
                     f2_full = os.path.join(f1_full, f2)
                     if os.path.isdir(f2_full):
                         for f3 in os.listdir(f2_full):
@@ -131,36 +143,49 @@ class BNCWordVecs(object):
                                     return
 
     def calculate_cd(self):
-        self.cds = {}
-        total_freq = sum(self.context_words.values())
-        p_context_words = dict((x, float(y) / total_freq) for x, y in
-                               self.context_words.items())
-
-        for w, vector in self.vectors.items():
-            total_freq = float(sum(vector.values()))
-            if total_freq == 0:
-                cd = None
-            else:
-                cd = 0
-                for cw, freq in vector.items():
-                    pcw = freq / total_freq
-                    pc = p_context_words[cw]
-                    if pcw == 0:
-                        term = 0
-                    else:
-                        term = pcw * (math.log(pcw / pc) / math.log(2))
-                    cd += term
-            self.cds[w] = cd
+        # Each target word's vector is a distribution over the context words,
+        # compared to the overall distribution of the context words; all of
+        # the divergences are computed at once. KL only sums over the context
+        # words that occur with the target, so only those are passed on
+        context_words = sorted(self.context_words)
+        context_ids = dict((cw, i) for i, cw in enumerate(context_words))
+        context_freqs = np.array([self.context_words[cw]
+                                  for cw in context_words], float)
+        context_probs = context_freqs / context_freqs.sum()
+        targets = sorted(self.vectors)
+        lengths = np.fromiter(
+            (sum(1 for freq in self.vectors[w].itervalues() if freq != 0)
+             for w in targets), np.int64, len(targets))
+        offsets = np.zeros(len(targets) + 1, np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        counts = np.fromiter(
+            (freq for w in targets for freq in self.vectors[w].itervalues()
+             if freq != 0), float, offsets[-1])
+        ids = np.fromiter(
+            (context_ids[cw] for w in targets
+             for cw, freq in self.vectors[w].iteritems() if freq != 0),
+            np.int64, offsets[-1])
+        # p is normalized over each vector here, and q over all of the
+        # context words rather than the ones passed on
+        owners = np.repeat(np.arange(len(targets)), lengths)
+        totals = np.bincount(owners, counts, minlength=len(targets))
+        p = counts / totals[owners]
+        cds = kl_divergences(p, context_probs[ids], offsets, normalize=False)
+        self.cds = dict((w, None if total == 0 else cd)
+                        for w, cd, total in zip(targets, cds, totals))
 
 
     def read_all(self, process=False):
         self.total_n_words = 0
         if process:
             self.initialize_matrix()
-        for filename in self.all_files():
-            words = self.read_file(filename)
-            if process:
-                self.process(words)
+        with instrument.phase('bnc.read_all') as phase:
+            for filename in self.all_files():
+                words = self.read_file(filename)
+                if process:
+                    self.process(words)
+                phase.add('files')
+            phase.add('tokens', self.total_n_words)
 
     def save_context_words(self, filename):
         common = self.frequencies.most_common(self.n_context_words)
@@ -0,0 +1,351 @@
+# License: BSD (3-clause)
+
+'''
+Flat storage for parsed lexicons. A table is a handful of NumPy arrays
+packed into a single buffer; the buffer is either a file that is mapped
+read-only (so that every process that opens it shares the same pages) or
+an anonymous shared memory region.
+'''
+
+import bisect
+import collections
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = 'LEXVARS\x01'
+ALIGNMENT = 64
+SEP = '\\'
+
+
+def _aligned(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(arrays, meta):
+    header = {'meta': meta, 'arrays': {}}
+    offset = 0
+    for name in sorted(arrays):
+        arr = arrays[name]
+        header['arrays'][name] = [arr.dtype.str, list(arr.shape), offset]
+        offset = _aligned(offset + arr.nbytes)
+    header = json.dumps(header)
+    start = _aligned(len(MAGIC) + 8 + len(header))
+    return header, start, start + offset
+
+
+def _fill(buf, arrays, header, start):
+    buf[:len(MAGIC) + 8] = MAGIC + struct.pack('<q', len(header))
+    buf[len(MAGIC) + 8:len(MAGIC) + 8 + len(header)] = header
+    for name, (dtype, shape, offset) in json.loads(header)['arrays'].items():
+        arr = np.ascontiguousarray(arrays[name])
+        buf[start + offset:start + offset + arr.nbytes] = arr.tostring()
+
+
+def _unpack(buf):
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a lexvars buffer')
+    header_len, = struct.unpack('<q', buf[len(MAGIC):len(MAGIC) + 8])
+    header = json.loads(buf[len(MAGIC) + 8:len(MAGIC) + 8 + header_len])
+    start = _aligned(len(MAGIC) + 8 + header_len)
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        dtype = np.dtype(str(dtype))
+        count = int(np.prod(shape))
+        if count == 0:
+            arr = np.zeros(shape, dtype)
+        else:
+            arr = np.frombuffer(buf, dtype, count, start + offset)
+            arr = arr.reshape(shape)
+        arr.flags.writeable = False
+        arrays[str(name)] = arr
+    return arrays, header['meta']
+
+
+def write_pack(filename, arrays, meta):
+    '''
+    Write a dictionary of NumPy arrays and a JSON-serializable metadata
+    object to filename. The file is written to a temporary name first and
+    then renamed, so concurrent readers never see a partial file.
+    '''
+    header, start, size = _layout(arrays, meta)
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        f = os.fdopen(fd, 'wb')
+        f.truncate(size)
+        f.close()
+        f = open(tmp, 'r+b')
+        buf = mmap.mmap(f.fileno(), size)
+        _fill(buf, arrays, header, start)
+        buf.flush()
+        buf.close()
+        f.close()
+        os.chmod(tmp, 0644)
+        os.rename(tmp, filename)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+def read_pack(filename):
+    '''
+    Map a file written by write_pack and return (arrays, meta). The arrays
+    are read-only views of the mapping.
+    '''
+    f = open(filename, 'rb')
+    try:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    return _unpack(buf)
+
+
+def shared_pack(arrays, meta):
+    '''
+    Copy the arrays into an anonymous shared memory region. Processes forked
+    after this call see the same physical pages.
+    '''
+    header, start, size = _layout(arrays, meta)
+    buf = mmap.mmap(-1, size)
+    _fill(buf, arrays, header, start)
+    return _unpack(buf)
+
+
+def is_mapped(arr):
+    '''
+    True if arr is a view of a memory map (a file mapped by read_pack, or
+    shared memory from shared_pack)
+    '''
+    base = arr
+    while isinstance(base, np.ndarray):
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+class StringTable(object):
+    '''
+    Sequence of byte strings stored as one character buffer plus an array
+    of offsets.
+    '''
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @staticmethod
+    def build(strings):
+        strings = list(strings)
+        offsets = np.zeros(len(strings) + 1, np.int64)
+        np.cumsum([len(s) for s in strings], out=offsets[1:])
+        data = np.frombuffer(''.join(strings), np.uint8)
+        return data, offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tostring()
+
+    def __iter__(self):
+        data = self.data.tostring()
+        offsets = self.offsets.tolist()
+        for i in xrange(len(offsets) - 1):
+            yield data[offsets[i]:offsets[i + 1]]
+
+
+class RowTable(collections.Sequence):
+    '''
+    Read-only sequence of dict rows. The scalar fields of each row are kept
+    as a single backslash-separated string, like a line in a CELEX .cd
+    file; nested lists of dicts (e.g. 'Parses') are stored as child tables.
+    Rows are materialized as fresh dicts on access.
+    '''
+
+    def __init__(self, fields, rows, children=None):
+        self.fields = fields
+        self.rows = rows
+        self.children = children or {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._make_row(i, self.rows[i])
+
+    def __iter__(self):
+        for i, row in enumerate(self.rows):
+            yield self._make_row(i, row)
+
+    def _make_row(self, i, row):
+        d = dict(zip(self.fields, row.split(SEP)))
+        for name, (table, offsets) in self.children.items():
+            d[name] = [table[j] for j in xrange(offsets[i], offsets[i + 1])]
+        return d
+
+    def column(self, field):
+        '''
+        List of the values of a scalar field, without building row dicts
+        '''
+        # As in _make_row, a field that appears twice takes the last value
+        j = len(self.fields) - 1 - self.fields[::-1].index(field)
+        return [row.split(SEP, j + 1)[j] for row in self.rows]
+
+    @classmethod
+    def from_dicts(cls, dicts, children=()):
+        '''
+        Builds a table from a list of dicts that all have the same keys.
+        children are the keys whose values are lists of dicts.
+        '''
+        fields = sorted(k for k in dicts[0] if k not in children) if dicts \
+            else []
+        rows = StringTable(*StringTable.build(
+            SEP.join([d[f] for f in fields]) for d in dicts))
+        nested = {}
+        for name in children:
+            if dicts and name not in dicts[0]:
+                continue
+            child = cls.from_dicts([x for d in dicts for x in d[name]])
+            parent = np.zeros(len(dicts) + 1, np.int64)
+            np.cumsum([len(d[name]) for d in dicts], out=parent[1:])
+            nested[name] = (child, parent)
+        return cls(fields, rows, nested)
+
+    @classmethod
+    def merge(cls, tables):
+        '''
+        Puts tables with the same number of rows side by side: row i of the
+        result has the fields of row i of each of the tables. If several
+        tables have the same field, the last one wins, as in dict.update.
+        '''
+        fields = []
+        children = {}
+        for table in tables:
+            fields += table.fields
+            children.update(table.children)
+        rows = StringTable(*StringTable.build(
+            SEP.join(parts) for parts in zip(*[t.rows for t in tables])))
+        return cls(fields, rows, children)
+
+    def to_arrays(self, prefix=''):
+        '''
+        Returns (arrays, meta) for write_pack or shared_pack
+        '''
+        arrays = {prefix + 'data': self.rows.data,
+                  prefix + 'offsets': self.rows.offsets}
+        meta = {'fields': self.fields, 'children': {}}
+        for name, (child, parent) in self.children.items():
+            child_prefix = '%s%s.' % (prefix, name)
+            child_arrays, meta['children'][name] = child.to_arrays(
+                child_prefix)
+            arrays.update(child_arrays)
+            arrays[child_prefix + 'parent'] = parent
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, prefix=''):
+        children = {}
+        for name, child_meta in meta['children'].items():
+            child_prefix = '%s%s.' % (prefix, name)
+            child = cls.from_arrays(arrays, child_meta, child_prefix)
+            children[str(name)] = (child, arrays[child_prefix + 'parent'])
+        rows = StringTable(arrays[prefix + 'data'], arrays[prefix + 'offsets'])
+        return cls([str(f) for f in meta['fields']], rows, children)
+
+
+class RowIndex(collections.Mapping):
+    '''
+    Read-only mapping from a key to the list of rows of a RowTable that
+    have that key. Keys are kept sorted in a StringTable and looked up by
+    binary search, so the index holds no per-key Python objects.
+    '''
+
+    def __init__(self, table, keys, starts, positions):
+        self.table = table
+        self.keys_table = keys
+        self.starts = starts
+        self.positions = positions
+        self._key_array = None
+
+    @staticmethod
+    def build(values):
+        '''
+        Returns the arrays for an index over a list of key values, one per
+        row; rows with the same key stay in their original order.
+        '''
+        order = sorted(xrange(len(values)), key=values.__getitem__)
+        keys = []
+        starts = []
+        for n, i in enumerate(order):
+            if not keys or values[i] != keys[-1]:
+                keys.append(values[i])
+                starts.append(n)
+        starts.append(len(order))
+        data, offsets = StringTable.build(keys)
+        return {'keys.data': data, 'keys.offsets': offsets,
+                'starts': np.array(starts, np.int64),
+                'positions': np.array(order, np.int64)}
+
+    @classmethod
+    def from_arrays(cls, table, arrays, prefix=''):
+        keys = StringTable(arrays[prefix + 'keys.data'],
+                           arrays[prefix + 'keys.offsets'])
+        return cls(table, keys, arrays[prefix + 'starts'],
+                   arrays[prefix + 'positions'])
+
+    def _find(self, key):
+        i = bisect.bisect_left(self.keys_table, key)
+        if i == len(self.keys_table) or self.keys_table[i] != key:
+            raise KeyError(key)
+        return i
+
+    def row_positions(self, key):
+        '''
+        Positions in the underlying table of the rows that have this key
+        '''
+        i = self._find(key)
+        return self.positions[self.starts[i]:self.starts[i + 1]].tolist()
+
+    def row_positions_many(self, keys):
+        '''
+        Positions of the rows that have each of the keys, as a flat array
+        and an array with the index in keys that each position belongs to.
+        Keys that are not in the index have no positions.
+        '''
+        if self._key_array is None:
+            self._key_array = np.array(list(self.keys_table), str)
+        keys = np.array(keys, str)
+        i = np.searchsorted(self._key_array, keys)
+        i[i == len(self._key_array)] = 0
+        found = (self._key_array[i] == keys) if len(self._key_array) > 0 \
+            else np.zeros(len(keys), bool)
+        starts = self.starts[i]
+        counts = np.where(found, self.starts[i + 1] - starts, 0)
+        owners = np.repeat(np.arange(len(keys)), counts)
+        ends = np.cumsum(counts)
+        offsets = np.arange(len(owners)) - np.repeat(ends - counts, counts)
+        return self.positions[np.repeat(starts, counts) + offsets], owners
+
+    def __getitem__(self, key):
+        return [self.table[j] for j in self.row_positions(key)]
+
+    def __contains__(self, key):
+        try:
+            self._find(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys_table)
+
+    def __len__(self):
+        return len(self.keys_table)
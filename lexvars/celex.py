@@ -2,7 +2,19 @@
 # 2011-2014
 # License: BSD (3-clause)
 
+import collections
+import hashlib
+import multiprocessing
+import multiprocessing.pool
 import os
+import warnings
+
+import numpy as np
+
+import instrument
+from buffers import (RowIndex, RowTable, is_mapped, read_pack, shared_pack,
+                     write_pack)
+from neighbourhood import NeighbourhoodIndex
 
 db_fields = {
     'efl': ['IdNum', 'Head', 'Cob', 'CobDev', 'CobMln', 'CobLog', 'CobW',
@@ -142,11 +154,145 @@ field_keys = {
 }
 
 
+def _read_db_job(args):
+    # Returns a RowTable, which is much cheaper to send back to the parent
+    # process than a list of dicts
+    celex_class, celex_english_root, db, fields = args
+    records = celex_class(celex_english_root, use_cache=False).read_db(
+        db, fields)
+    return RowTable.from_dicts(records, children=['Parses', 'Prons'])
+
+
+def _lookup_ids(lookup, key):
+    # Row i of the table has IdNum i + 1
+    return [i + 1 for i in lookup.row_positions(key)]
+
+
+def _lookup_id_groups(lookup, keys):
+    positions, owners = lookup.row_positions_many(keys)
+    return positions + 1, owners
+
+
+def _column(records, field):
+    return records.column(field)
+
+
+def _item_column(records, name, field):
+    # Values of field in each element of the nested list name of each
+    # record, as a list of lists
+    table, parent = records.children[name]
+    values = table.column(field)
+    parent = parent.tolist()
+    return [values[start:end]
+            for start, end in zip(parent[:-1], parent[1:])]
+
+
+def _first_item_column(records, name, field):
+    # Value of field in the first element of the nested list name of each
+    # record (e.g. the primary pronunciation), or None if the list is empty
+    return [x[0] if x else None for x in _item_column(records, name, field)]
+
+
+def strip_disc(transcription):
+    '''
+    Removes the stress marks and syllable boundaries from a DISC
+    transcription (e.g. PhonStrsDISC), which leaves one character per
+    phoneme
+    '''
+    return transcription.translate(None, '\'"-')
+
+
+_array_types = {
+    int: np.int64,
+    float: np.float64,
+    'boolean': np.bool_,
+    'decoded_num': np.int16
+}
+
+
+def _numeric_column(records, record_class, field):
+    dtype = _array_types.get(record_class._field_types.get(field))
+    if dtype is None:
+        raise ValueError('Field "%s" is not a numeric %s field' %
+                         (field, record_class.__name__))
+    values = np.array(_column(records, field))
+    column = np.zeros(len(values) + 1, dtype)
+    if dtype is np.bool_:
+        column[1:] = values == 'Y'
+    elif len(values) > 0:
+        values[values == ''] = '0'
+        column[1:] = values.astype(np.float64 if dtype is np.float64
+                                   else np.int64)
+    return column
+
+
+def _decoder(field, field_type):
+    if field_type == 'decoded_list':
+        keys = field_keys[field]
+        return lambda value: [keys[x] for x in value]
+    elif field_type == 'decoded_char':
+        keys = field_keys[field]
+        def decode(value):
+            if len(value) > 1:
+                raise ValueError('More than one character in field "%s": '
+                                 '"%s"' % (field, value))
+            return keys[value]
+        return decode
+    elif field_type == 'decoded_num':
+        keys = field_keys[field]
+        return lambda value: keys[int(value)]
+    elif field_type == 'boolean':
+        def decode(value):
+            if value not in ['Y', 'N']:
+                raise ValueError('Unexpected value for boolean field "%s": '
+                                 '"%s"' % (field, value))
+            return value == 'Y'
+        return decode
+    else:
+        return field_type
+
+
+class _CelexRecordType(type):
+    '''
+    Compiles the decoding plan of a CelexRecord class once, when the class
+    is created: a slot for each field, and a dictionary from the attribute
+    name to the raw field and the function that decodes it. Derived fields
+    are computed from the whole raw record.
+    '''
+
+    def __new__(mcs, name, bases, namespace):
+        def inherited(attr):
+            if attr in namespace:
+                return namespace[attr]
+            for base in bases:
+                if hasattr(base, attr):
+                    return getattr(base, attr)
+
+        fields = list(inherited('_subclass_fields') or [])
+        if inherited('_has_frequency'):
+            fields += inherited('_frequency_fields')
+        plan = {}
+        for field, field_type, doc in fields:
+            plan[field] = (field, _decoder(field, field_type))
+        for field, decode in inherited('_derived_fields') or []:
+            plan[field] = (None, decode)
+        namespace.setdefault('__slots__', tuple(sorted(plan)))
+        cls = type.__new__(mcs, name, bases, namespace)
+        cls._plan = plan
+        cls._documentation = dict((x[0], x[2]) for x in fields)
+        cls._field_types = dict((x[0], x[1]) for x in fields)
+        cls._checked_keys = set()
+        return cls
+
+
 class CelexRecord(object):
     '''
-    Base class for CelexLemma and CelexWordform
+    Base class for CelexLemma and CelexWordform. Fields are decoded from the
+    raw record the first time they are accessed.
     '''
 
+    __metaclass__ = _CelexRecordType
+
     _frequency_fields = [
         ('Cob', int, 'Frequency in the COBUILD corpus (17.9m words)'),
         ('CobDev', int, 'How good is the frequency estimate, when the '
@@ -166,40 +312,38 @@ class CelexRecord(object):
          'in written part of corpus (1.3m words)')
     ]
 
-    def __init__(self, d):
-        self._d = d
-
-        fields = self._subclass_fields
-        if self._has_frequency:
-            fields += self._frequency_fields
+    __slots__ = ('_d',)
 
-        self._documentation = {}
+    _subclass_fields = []
+    _derived_fields = []
+    _has_frequency = False
 
-        for field, field_type, doc in fields:
-            if field not in d:
-                continue
-            self._documentation[field] = doc
-            if field_type == 'decoded_list':
-                setattr(self, field, [field_keys[field][x] for x in d[field]])
-            elif field_type == 'decoded_char':
-                if len(d[field]) > 1:
-                    raise ValueError('More than one character in field "%s": '
-                                     '"%s"' % (field, d[field]))
-                setattr(self, field, field_keys[field][d[field]])
-            elif field_type == 'decoded_num':
-                setattr(self, field, field_keys[field][int(d[field])])
-            elif field_type == 'boolean':
-                if d[field] not in ['Y', 'N']:
-                    raise ValueError('Unexpected value for boolean field "%s": '
-                                     '"%s"' % (field, d[field]))
-                setattr(self, field, d[field] == 'Y')
-            else:
-                setattr(self, field, field_type(d[field]))
+    def __init__(self, d):
+        self._d = d
+        keys = frozenset(d)
+        if keys not in self._checked_keys:
+            diff = keys - set(self._plan)
+            if len(diff) > 0:
+                raise ValueError('Unconverted fields: %r' % diff)
+            self._checked_keys.add(keys)
+
+    def __getattr__(self, name):
+        # Only called when the slot hasn't been filled yet
+        try:
+            field, decode = self._plan[name]
+        except KeyError:
+            raise AttributeError(name)
+        if field is None:
+            value = decode(self._d)
+        elif field in self._d:
+            value = decode(self._d[field])
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
 
-        converted = set(x for x in self.__dict__.keys() if x[0] != '_')
-        diff = set(d.keys()) - converted
-        if len(set(diff)) > 0:
-            raise ValueError('Unconverted fields: %r' % diff)
+    def __reduce__(self):
+        return (self.__class__, (self._d,))
 
     def help(self, field):
         print self._documentation[field]
@@ -237,11 +381,11 @@ class CelexMorphParse(CelexRecord):
          'and nothing happens to the last morpheme -ed.')
     ]
 
-    _has_frequency = False
+    _derived_fields = [
+        ('Imm', lambda d: d['Imm'].split('+'))
+    ]
 
-    def __init__(self, d):
-        self.Imm = d['Imm'].split('+')
-        super(CelexMorphParse, self).__init__(d)
+    _has_frequency = False
 
     def __repr__(self):
         return '<CelexMorphParse %s>' % self.Imm
@@ -333,12 +477,12 @@ class CelexLemma(CelexRecord):
         ('Wh_PRON', 'boolean', 'Wh pronoun ("who", "howsoever")')
     ]
 
-    _has_frequency = True
+    _derived_fields = [
+        ('Parses', lambda d: [CelexMorphParse(x) for x in d.get('Parses', [])]),
+        ('Prons', lambda d: [CelexPronunciation(x) for x in d.get('Prons', [])])
+    ]
 
-    def __init__(self, d):
-        self.Parses = [CelexMorphParse(x) for x in d['Parses']]
-        self.Prons = [CelexPronunciation(x) for x in d['Prons']]
-        super(CelexLemma, self).__init__(d)
+    _has_frequency = True
 
     def __repr__(self):
         if hasattr(self, 'ClassNum'):
@@ -362,16 +506,64 @@ class CelexWordform(CelexRecord):
         ('Head', str, 'Head')
     ]
 
-    _has_frequency = True
+    _derived_fields = [
+        ('Prons', lambda d: [CelexPronunciation(x) for x in d.get('Prons', [])])
+    ]
 
-    def __init__(self, d):
-        self.Prons = [CelexPronunciation(x) for x in d['Prons']]
-        super(CelexWordform, self).__init__(d)
+    _has_frequency = True
 
     def __repr__(self):
         return '<CelexWordform %d "%s">' % (self.IdNum, self.Word)
 
 
+CacheInfo = collections.namedtuple('CacheInfo',
+                                   ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class RecordCache(object):
+    '''
+    Cache of record objects by key. If maxsize is None the cache is never
+    evicted; otherwise the least recently used record is dropped when the
+    cache grows past maxsize (so maxsize=0 disables caching).
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        if self.maxsize is None:
+            self._records = {}
+        else:
+            self._records = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make_record):
+        records = self._records
+        if key in records:
+            self.hits += 1
+            if self.maxsize is None:
+                return records[key]
+            # Move to the most recently used end
+            record = records.pop(key)
+            records[key] = record
+            return record
+        self.misses += 1
+        with instrument.phase('celex.records') as phase:
+            record = make_record()
+            phase.add('records')
+        if self.maxsize != 0:
+            records[key] = record
+            if self.maxsize is not None and len(records) > self.maxsize:
+                records.popitem(last=False)
+        return record
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._records))
+
+
 class Celex(object):
     '''
     Supported DBs are 's' (syntax), 'm' (morphology), 'f' (frequency)
@@ -399,11 +591,43 @@ class Celex(object):
     max_epl_prons = 24
     max_epw_prons = 23
 
-    def __init__(self, celex_english_root, dbs=None):
+    # Parsed DBs are cached in a flat binary format that is memory-mapped
+    # on later loads (see buffers.py); bump this when the format changes
+    cache_version = 1
+    default_cache_dir = os.path.expanduser('~/.lexvars_cache')
+
+    def __init__(self, celex_english_root, dbs=None, cache_dir=None,
+                 use_cache=True, fields=None, parallel=False,
+                 record_cache_size=50000):
+        '''
+        cache_dir: directory for the cached parsed DBs (default
+            ~/.lexvars_cache). The cache is keyed by the selected DBs and
+            the size and modification time of their .cd files.
+
+        use_cache: if False, always parse the .cd files
+
+        fields: if given, only these fields are kept when loading lemmas and
+            wordforms, and DBs that provide none of them are not read (e.g.
+            ['Head', 'Cob', 'ClassNum'] only reads the syntax DB). 'IdNum',
+            'Head' and 'Word' are always kept. Morphological parses and
+            pronunciations are requested as 'Parses' and 'Prons'.
+
+        parallel: if 'process' (or True) or 'thread', the DBs that make up
+            the lemma or wordform records are parsed concurrently, each in
+            its own process or thread, and then joined on IdNum
+
+        record_cache_size: number of CelexLemma and CelexWordform objects to
+            keep, so that lookups of the same IdNum return the same object
+            (None to keep all of them, 0 to always create new objects)
+        '''
         self._lemmas = None
         self._wordforms = None
         self._lemmas_to_wordforms = None
+        self._lemma_fields = None
+        self._wordform_fields = None
         self.celex_english_root = celex_english_root
+        self.cache_dir = cache_dir or self.default_cache_dir
+        self.use_cache = use_cache
         if dbs is None:
             self.dbs = self.supported_dbs
         else:
@@ -411,123 +635,628 @@ class Celex(object):
             if len(diff) > 0:
                 raise ValueError('Unknown DBs %s' % diff)
             self.dbs = dbs
+        if fields is not None:
+            known = set()
+            for db in self.lemma_dbs() + self.wordform_dbs():
+                known.update(self._db_layout(db)[0])
+            diff = set(fields) - known
+            if len(diff) > 0:
+                raise ValueError('Unknown fields %s' % diff)
+        self.fields = fields
+        if parallel not in [False, True, 'process', 'thread']:
+            raise ValueError('Unknown parallel mode "%s"' % parallel)
+        self.parallel = parallel
+        self._record_cache = RecordCache(record_cache_size)
+        self._arrays = {}
+        self._neighbourhood_indexes = {}
+
+    def lemma_dbs(self):
+        return ['e%sl' % db for db in self.dbs]
+
+    def wordform_dbs(self):
+        # No syntax DB for wordforms
+        return ['e%sw' % db for db in self.dbs if db != 's']
 
-    def load_lemmas(self):
+    def load_lemmas(self, fields=None):
+        '''
+        fields: load only these fields (see Celex.__init__); if the lemmas
+            are already loaded without some of them, they are reloaded with
+            the union of both sets of fields
+        '''
+        loaded = self._lemma_fields
+        fields = self._projection(self.lemma_dbs(), fields,
+                                  self._lemmas is not None, loaded, 'Head')
         if self._lemmas is not None:
-            return
-        l = []
-        self._lemmas = self.read_dbs(['e%sl' % db for db in self.dbs])
-        self._lemma_lookup = {}
-        for lemma in self._lemmas:
-            self._lemma_lookup.setdefault(lemma['Head'], []).append(lemma)
+            if fields == loaded:
+                return
+            # Reloading with more fields: cached records are stale
+            self._record_cache.clear()
+            self._arrays = {}
+        with instrument.phase('celex.load.lemmas'):
+            self._lemmas, self._lemma_lookup = self._load_table(
+                'lemmas', self.lemma_dbs(), fields, 'Head')
+        self._lemma_fields = fields
+        self._lemmas_to_wordforms = None
 
-    def load_wordforms(self):
+    def load_wordforms(self, fields=None):
+        '''
+        fields: see load_lemmas
+        '''
+        loaded = self._wordform_fields
+        fields = self._projection(self.wordform_dbs(), fields,
+                                  self._wordforms is not None, loaded, 'Word')
         if self._wordforms is not None:
-            return
-        # No syntax DB for wordforms
-        self._wordforms = self.read_dbs(['e%sw' % db for db in self.dbs 
-                                         if db != 's'])
-        self._wf_lookup = {}
-        for wf in self._wordforms:
-            self._wf_lookup.setdefault(wf['Word'], []).append(wf)
+            if fields == loaded:
+                return
+            # Reloading with more fields: cached records are stale
+            self._record_cache.clear()
+            self._arrays = {}
+        with instrument.phase('celex.load.wordforms'):
+            self._wordforms, self._wf_lookup = self._load_table(
+                'wordforms', self.wordform_dbs(), fields, 'Word')
+        self._wordform_fields = fields
+        self._lemmas_to_wordforms = None
+
+    def _require_lemmas(self, fields):
+        # Loads the lemmas as configured, and reloads them with the given
+        # fields if the projection (see Celex.__init__) left some of them out
+        self.load_lemmas()
+        self.load_lemmas(fields)
+
+    def _require_wordforms(self, fields):
+        self.load_wordforms()
+        self.load_wordforms(fields)
+
+    def _projection(self, dbs, fields, is_loaded, loaded, key):
+        '''
+        Returns the sorted list of fields to load from dbs (None for all
+        fields), given the requested fields and those already loaded
+        '''
+        if fields is None:
+            if is_loaded:
+                return loaded
+            if self.fields is None:
+                return None
+            available = set()
+            for db in dbs:
+                available.update(self._db_layout(db)[0])
+            fields = available.intersection(self.fields)
+        else:
+            # Raises ValueError if some of the fields are not in dbs
+            self._select_dbs(dbs, fields)
+            if is_loaded and loaded is None:
+                return None
+        fields = set(fields) | set(['IdNum', key])
+        if loaded is not None:
+            fields |= set(loaded)
+        return sorted(fields)
+
+    def _load_table(self, name, dbs, fields, key):
+        '''
+        Returns the joined records of the given DBs as a RowTable and a
+        RowIndex from the key field to the records, from the cache if it is
+        up to date. Freshly parsed DBs are saved to the cache and mapped
+        back from it, so the tables are the same however they were loaded.
+        '''
+        dbs = self._select_dbs(dbs, fields)
+        filename = None
+        if self.use_cache:
+            filename = self._cache_filename(name, dbs, fields)
+            if os.path.exists(filename):
+                with instrument.phase('celex.cache_read') as phase:
+                    records, lookup = self._read_table(filename)
+                    phase.add('rows', len(records))
+                return records, lookup
+
+        records = self.read_dbs(dbs, fields)
+        with instrument.phase('celex.index') as phase:
+            arrays, meta = self._table_arrays(records, key)
+            phase.add('rows', len(records))
+        if filename is not None:
+            with instrument.phase('celex.cache_write') as phase:
+                written = self._write_pack(filename, arrays, meta)
+                phase.add('rows', len(records))
+            if written:
+                return self._read_table(filename)
+        records = RowTable.from_arrays(arrays, meta, 'rows.')
+        return records, RowIndex.from_arrays(records, arrays, 'index.')
+
+    def _read_table(self, filename):
+        arrays, meta = read_pack(filename)
+        records = RowTable.from_arrays(arrays, meta, 'rows.')
+        return records, RowIndex.from_arrays(records, arrays, 'index.')
+
+    def _table_arrays(self, records, key):
+        # The records and an index on key as (arrays, meta) for write_pack or
+        # shared_pack
+        if not isinstance(records, RowTable):
+            records = RowTable.from_dicts(records, children=['Parses', 'Prons'])
+        arrays, meta = records.to_arrays('rows.')
+        index = RowIndex.build(records.column(key))
+        arrays.update(('index.' + k, v) for k, v in index.items())
+        return arrays, meta
+
+    def _cache_filename(self, name, dbs, fields=None, version=None):
+        # name-<selection>-<fingerprint>.lxv, where the selection identifies
+        # the DBs and fields, and the fingerprint their current contents (and
+        # the version of the other inputs, if any)
+        selection = hashlib.sha1(' '.join(dbs) + '|' +
+                                 ' '.join(sorted(fields or []))).hexdigest()
+        fingerprint = self.fingerprint(dbs, fields)
+        if version is not None:
+            fingerprint = hashlib.sha1(
+                '%s %s' % (fingerprint, version)).hexdigest()[:16]
+        return os.path.join(self.cache_dir, '%s-%s-%s.lxv' % (
+            name, selection[:8], fingerprint))
+
+    def _write_pack(self, filename, arrays, meta):
+        '''
+        Saves the arrays to the cache, and removes the files that were saved
+        for the same table from earlier contents of the DBs. Returns False
+        (with a warning) if the cache directory isn't writable.
+        '''
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            write_pack(filename, arrays, meta)
+        except (IOError, OSError) as e:
+            warnings.warn('Could not write CELEX cache: %s' % e)
+            return False
+        current = os.path.basename(filename)
+        prefix = current[:current.rindex('-') + 1]
+        for other in os.listdir(self.cache_dir):
+            if other.startswith(prefix) and other.endswith('.lxv') and \
+                    other != current:
+                try:
+                    os.unlink(os.path.join(self.cache_dir, other))
+                except OSError:
+                    pass
+        return True
+
+    def cached_arrays(self, name, dbs, build, version=None):
+        '''
+        Data derived from the given DBs (e.g. the derivational families in
+        LexVars), as the (arrays, meta) pair returned by build(): read from
+        the cache directory if it was saved for the current contents of the
+        DBs, and otherwise built and saved there (see write_pack)
+
+        version: a string identifying any other input of build (e.g. the
+            WordNet version); data saved for another version is rebuilt
+        '''
+        if not self.use_cache:
+            return build()
+        filename = self._cache_filename(name, dbs, version=version)
+        if os.path.exists(filename):
+            return read_pack(filename)
+        arrays, meta = build()
+        self._write_pack(filename, arrays, meta)
+        return arrays, meta
+
+    def _db_filename(self, db):
+        return os.path.join(self.celex_english_root, db, '%s.cd' % db)
+
+    def fingerprint(self, dbs, fields=None):
+        '''
+        Identifies the current contents of the given DBs: a hash of the cache
+        format version, the DB names and the size and modification time of
+        their .cd files (and the field projection, if any)
+        '''
+        h = hashlib.sha1('v%d' % self.cache_version)
+        for db in dbs:
+            st = os.stat(self._db_filename(db))
+            h.update('%s %d %r\n' % (db, st.st_size, st.st_mtime))
+        if fields is not None:
+            h.update(' '.join(sorted(fields)))
+        return h.hexdigest()[:16]
 
     def map_lemmas_to_wordforms(self):
         if self._lemmas_to_wordforms is not None:
             return
         self.load_lemmas()
         self.load_wordforms()
-        self._lemmas_to_wordforms = [[] for x in range(len(self._lemmas))]
-        for wordform in self._wordforms:
-            wf_id = int(wordform['IdNum'])
-            lemma_id = int(wordform['IdNumLemma'])
-            lemma = self._lemmas[lemma_id - 1]
-            assert int(lemma['IdNum']) == lemma_id
-            self._lemmas_to_wordforms[lemma_id - 1].append(wf_id)
-
-    def read_dbs(self, dbs):
-        first_db = self.read_db(dbs[0])
-        for other_db_name in dbs[1:]:
-            other_db = self.read_db(other_db_name)
-            for first, other in zip(first_db, other_db):
-                first.update(other)
-        return first_db
-
-    def read_db(self, db):
-        fname = os.path.join(self.celex_english_root, db, '%s.cd' % db)
-        records = []
-        for x in open(fname).readlines():
-            actual_fields = x.strip().split('\\')
-            if db == 'eml':
-                n_parses = min(max(1, int(actual_fields[5])), 
-                               self.max_parses)
-                expected_fields = self.eml_base + n_parses * self.eml_parse
-            elif db == 'epl':
-                cnt = len(self.epl_base) - 1
-                n_prons = min(max(1, int(actual_fields[cnt])), 
-                              self.max_epl_prons)
-                expected_fields = self.epl_base + n_prons * self.ep_pron
-            elif db == 'epw':
-                cnt = len(self.epw_base) - 1
-                n_prons = min(max(1, int(actual_fields[cnt])),
-                              self.max_epw_prons)
-                expected_fields = self.epw_base + n_prons * self.ep_pron
+        lemma_ids = np.array(_column(self._lemmas, 'IdNum'), np.int64)
+        wf_ids = np.array(_column(self._wordforms, 'IdNum'), np.int64)
+        wf_lemmas = np.array(_column(self._wordforms, 'IdNumLemma'), np.int64)
+        assert (lemma_ids[wf_lemmas - 1] == wf_lemmas).all()
+        # The wordforms of lemma i are wf_ids[offsets[i - 1]:offsets[i]], in
+        # their original order
+        order = np.argsort(wf_lemmas, kind='mergesort')
+        offsets = np.searchsorted(wf_lemmas[order],
+                                  np.arange(1, len(lemma_ids) + 2))
+        self._lemmas_to_wordforms = offsets, wf_ids[order]
+
+    def freeze(self):
+        '''
+        Moves the loaded lemmas and wordforms, the indexes used by
+        lemma_lookup and wordform_lookup, and the lemma to wordform mapping
+        (if it was built) into anonymous shared memory (see
+        buffers.shared_pack), as string tables and offset arrays with no
+        per-row Python objects. Processes that are forked afterwards use
+        the same physical pages for all of them, however many there are.
+        Tables that were read from the cache are mapped from the cache file
+        and are already shared, so they are left as they are.
+
+        Call freeze after loading everything the workers need: loading more
+        fields afterwards replaces the frozen tables.
+        '''
+        if self._lemmas is not None:
+            self._lemmas, self._lemma_lookup = self._freeze_table(
+                self._lemmas, self._lemma_lookup, 'Head')
+        if self._wordforms is not None:
+            self._wordforms, self._wf_lookup = self._freeze_table(
+                self._wordforms, self._wf_lookup, 'Word')
+        if self._lemmas_to_wordforms is not None and \
+                not is_mapped(self._lemmas_to_wordforms[0]):
+            arrays, meta = shared_pack(
+                dict(zip(['offsets', 'ids'], self._lemmas_to_wordforms)), {})
+            self._lemmas_to_wordforms = arrays['offsets'], arrays['ids']
+        self._record_cache.clear()
+        for key, array in self._arrays.items():
+            if not is_mapped(array):
+                self._arrays[key] = shared_pack({'a': array}, {})[0]['a']
+
+    def _freeze_table(self, records, lookup, key):
+        if is_mapped(records.rows.data):
+            return records, lookup
+        arrays, meta = shared_pack(*self._table_arrays(records, key))
+        records = RowTable.from_arrays(arrays, meta, 'rows.')
+        return records, RowIndex.from_arrays(records, arrays, 'index.')
+
+    def _db_layout(self, db):
+        '''
+        Returns (fields, base, nested) for the DB: the fields that its
+        records can have, the fields at the start of each line, and, for DBs
+        with a variable number of parses or pronunciations, a tuple
+        (name, fields per item, index of the count field, max items)
+        '''
+        if db == 'eml':
+            nested = ('Parses', self.eml_parse, 5, self.max_parses)
+            base = self.eml_base
+        elif db == 'epl':
+            nested = ('Prons', self.ep_pron, len(self.epl_base) - 1,
+                      self.max_epl_prons)
+            base = self.epl_base
+        elif db == 'epw':
+            nested = ('Prons', self.ep_pron, len(self.epw_base) - 1,
+                      self.max_epw_prons)
+            base = self.epw_base
+        else:
+            return db_fields[db], db_fields[db], None
+        return base + [nested[0]], base, nested
+
+    def _select_dbs(self, dbs, fields):
+        '''
+        The DBs (out of dbs) that need to be read to get the given fields:
+        each field is taken from the first DB that has it
+        '''
+        if fields is None:
+            return dbs
+        missing = set(fields) - set(['IdNum'])
+        selected = []
+        for db in dbs:
+            provided = missing.intersection(self._db_layout(db)[0])
+            if len(provided) > 0:
+                selected.append(db)
+                missing -= provided
+        if len(missing) > 0:
+            raise ValueError('Fields %s not found in DBs %s' % (missing, dbs))
+        return selected or dbs[:1]
+
+    def read_dbs(self, dbs, fields=None):
+        if not self.parallel or len(dbs) == 1:
+            tables = [self.read_db(db, fields) for db in dbs]
+        else:
+            if self.parallel == 'thread':
+                pool = multiprocessing.pool.ThreadPool(len(dbs))
             else:
-                expected_fields = db_fields[db]
-
-            if len(expected_fields) != len(actual_fields):
-                raise ValueError('Number of fields (%d) doesn\'t match '
-                                 'expected number (%d)' % 
-                                 (len(actual_fields), len(expected_fields)))
-            if db == 'eml':
-                record = self.parse_eml(actual_fields)
-            elif db == 'epl':
-                record = self.parse_ep(self.epl_base, self.max_epl_prons,
-                                       actual_fields) 
-            elif db == 'epw':
-                record = self.parse_ep(self.epw_base, self.max_epw_prons,
-                                       actual_fields) 
+                pool = multiprocessing.Pool(len(dbs))
+            try:
+                with instrument.phase('celex.read_dbs_parallel') as phase:
+                    tables = pool.map(_read_db_job, [
+                        (self.__class__, self.celex_english_root, db, fields)
+                        for db in dbs])
+                    phase.add('rows', sum(len(table) for table in tables))
+            finally:
+                pool.close()
+                pool.join()
+        with instrument.phase('celex.join') as phase:
+            phase.add('rows', len(tables[0]))
+            if isinstance(tables[0], RowTable):
+                ids = [table.column('IdNum') for table in tables]
+                if all(x == ids[0] for x in ids[1:]):
+                    return RowTable.merge(tables)
+                tables = [list(table) for table in tables]
+            return self.join_dbs(dbs, tables)
+
+    def join_dbs(self, dbs, tables):
+        '''
+        Merges the records of the tables (read from dbs) that have the same
+        IdNum into the records of the first table. Raises ValueError if
+        the tables don't have exactly the same IdNums.
+        '''
+        joined = tables[0]
+        for db, table in zip(dbs[1:], tables[1:]):
+            if len(table) != len(joined):
+                raise ValueError('%s has %d records but %s has %d' %
+                                 (dbs[0], len(joined), db, len(table)))
+            for first, other in zip(joined, table):
+                if first['IdNum'] != other['IdNum']:
+                    break
+                first.update(other)
             else:
-                record = dict(zip(expected_fields, actual_fields))
-            records.append(record)
+                continue
+            # The records are not in the same order
+            by_id = dict((x['IdNum'], x) for x in table)
+            if len(by_id) != len(table):
+                raise ValueError('Duplicate IdNums in %s' % db)
+            for first in joined:
+                other = by_id.get(first['IdNum'])
+                if other is None:
+                    raise ValueError('IdNum %s of %s not found in %s' %
+                                     (first['IdNum'], dbs[0], db))
+                first.update(other)
+        return joined
+
+    def read_db(self, db, fields=None):
+        with instrument.phase('celex.read_db.%s' % db) as phase:
+            records = list(self.iter_db(db, fields))
+            phase.add('rows', len(records))
         return records
 
+    def iter_db(self, db, fields=None):
+        '''
+        Generator over the records of a DB, one dict per line of the .cd
+        file. If fields is given, only those fields (and IdNum) are kept,
+        and lines are split only as far as the last field that is needed.
+        '''
+        all_fields, base, nested = self._db_layout(db)
+        if fields is None:
+            fields = all_fields
+        keep = [(f, base.index(f)) for f in base
+                if f in fields or f == 'IdNum']
+        parse_nested = nested is not None and nested[0] in fields
+        if nested is None:
+            maxsplit = max(i for f, i in keep) + 1
+        elif parse_nested:
+            maxsplit = -1
+        else:
+            maxsplit = max([i for f, i in keep] + [nested[2]]) + 1
+
+        with open(self._db_filename(db)) as f:
+            for line in f:
+                line = line.strip()
+                actual_fields = line.split('\\', maxsplit)
+                n_fields = line.count('\\') + 1
+                if nested is None:
+                    n_expected = len(base)
+                else:
+                    name, item_fields, cnt, max_items = nested
+                    n_items = min(max(1, int(actual_fields[cnt])), max_items)
+                    n_expected = len(base) + n_items * len(item_fields)
+
+                if n_expected != n_fields:
+                    raise ValueError('Number of fields (%d) doesn\'t match '
+                                     'expected number (%d)' % 
+                                     (n_fields, n_expected))
+
+                record = dict((f, actual_fields[i]) for f, i in keep)
+                if parse_nested:
+                    n_items = min(int(actual_fields[cnt]), max_items)
+                    record[name] = self._parse_items(
+                        actual_fields, len(base), item_fields, n_items)
+                yield record
+
+    def _parse_items(self, fields, start, item_fields, n_items):
+        items = []
+        for i in range(n_items):
+            begin = start + i * len(item_fields)
+            end = start + (i + 1) * len(item_fields)
+            items.append(dict(zip(item_fields, fields[begin:end])))
+        return items
+
     def parse_eml(self, fields):
         record = dict(zip(self.eml_base, fields))
-        record['Parses'] = []
         n_parses = min(int(record['MorphCnt']), self.max_parses)
-        for i in range(n_parses):
-            start = len(self.eml_base) + i * len(self.eml_parse)
-            end = len(self.eml_base) + (i + 1) * len(self.eml_parse)
-            d = dict(zip(self.eml_parse, fields[start:end]))
-            record['Parses'].append(d)
+        record['Parses'] = self._parse_items(fields, len(self.eml_base),
+                                             self.eml_parse, n_parses)
         return record
 
     def parse_ep(self, ep_base, max_prons, fields):
         record = dict(zip(ep_base, fields))
-        record['Prons'] = []
         n_prons = min(int(record['PronCnt']), max_prons)
-        for i in range(n_prons):
-            start = len(ep_base) + i * len(self.ep_pron)
-            end = len(ep_base) + (i + 1) * len(self.ep_pron)
-            d = dict(zip(self.ep_pron, fields[start:end]))
-            record['Prons'].append(d)
+        record['Prons'] = self._parse_items(fields, len(ep_base),
+                                            self.ep_pron, n_prons)
         return record
 
     def lemma_by_id(self, lemma_id):
         self.load_lemmas()
-        return CelexLemma(self._lemmas[lemma_id - 1])
+        return self._record_cache.get(
+            ('lemma', lemma_id),
+            lambda: CelexLemma(self._lemmas[lemma_id - 1]))
 
     def lemma_lookup(self, x):
         self.load_lemmas()
-        return [CelexLemma(l) for l in self._lemma_lookup[x]]
+        return [self.lemma_by_id(lemma_id) for lemma_id in
+                _lookup_ids(self._lemma_lookup, x)]
 
     def wordform_by_id(self, wf_id):
         self.load_wordforms()
-        return CelexWordform(self._wordforms[wf_id - 1])
+        return self._record_cache.get(
+            ('wordform', wf_id),
+            lambda: CelexWordform(self._wordforms[wf_id - 1]))
 
     def wordform_lookup(self, x):
         self.load_wordforms()
-        return [CelexWordform(wf) for wf in self._wf_lookup[x]]
+        return [self.wordform_by_id(wf_id) for wf_id in
+                _lookup_ids(self._wf_lookup, x)]
+
+    def lemma_column(self, field):
+        '''
+        List of the raw (string) values of a lemma field, in IdNum order
+        '''
+        self._require_lemmas([field])
+        return _column(self._lemmas, field)
+
+    def wordform_column(self, field):
+        self._require_wordforms([field])
+        return _column(self._wordforms, field)
+
+    def lemma_pronunciations(self, field='PhonStrsDISC'):
+        '''
+        List of the given field of the first (primary) pronunciation of each
+        lemma, in IdNum order; None for lemmas without a pronunciation
+        '''
+        self._require_lemmas(['Prons'])
+        return _first_item_column(self._lemmas, 'Prons', field)
+
+    def lemma_parses(self, field='Imm'):
+        '''
+        The given field of each of the morphological parses of each lemma,
+        as a list of lists in IdNum order
+        '''
+        self._require_lemmas(['Parses'])
+        return _item_column(self._lemmas, 'Parses', field)
+
+    def wordform_pronunciations(self, field='PhonStrsDISC'):
+        self._require_wordforms(['Prons'])
+        return _first_item_column(self._wordforms, 'Prons', field)
+
+    def neighbourhood_index(self, kind='orthographic', lexicon='wordforms',
+                            include_multiword=False):
+        '''
+        NeighbourhoodIndex over the spellings (kind='orthographic') or the
+        stress-stripped DISC transcriptions of the primary pronunciations
+        (kind='phonological') of the wordforms, or of the lemmas if lexicon
+        is 'lemmas'. The frequency of each string is the total COBUILD
+        frequency of the entries spelled or pronounced that way. The index
+        is built on first use and kept for the lifetime of this object.
+
+        include_multiword: if False, entries whose spelling contains a
+            space or a hyphen are left out
+        '''
+        key = (kind, lexicon, include_multiword)
+        if key in self._neighbourhood_indexes:
+            return self._neighbourhood_indexes[key]
+        if lexicon not in ['wordforms', 'lemmas']:
+            raise ValueError('Unknown lexicon "%s"' % lexicon)
+        if kind == 'orthographic':
+            strings = None
+        elif kind == 'phonological':
+            if lexicon == 'wordforms':
+                strings = self.wordform_pronunciations()
+            else:
+                strings = self.lemma_pronunciations()
+        else:
+            raise ValueError('Unknown neighbourhood kind "%s"' % kind)
+
+        if lexicon == 'wordforms':
+            spellings = self.wordform_column('Word')
+            frequencies = self.wordform_array('Cob')[1:].tolist()
+        else:
+            spellings = self.lemma_column('Head')
+            frequencies = self.lemma_array('Cob')[1:].tolist()
+        if strings is None:
+            strings = spellings
+        else:
+            strings = [x if x is None else strip_disc(x) for x in strings]
+
+        totals = {}
+        for spelling, string, freq in zip(spellings, strings, frequencies):
+            multiword = '-' in spelling or ' ' in spelling
+            if string is None or (multiword and not include_multiword):
+                continue
+            totals[string] = totals.get(string, 0) + freq
+        strings = sorted(totals)
+        with instrument.phase('celex.neighbourhood_index') as phase:
+            index = NeighbourhoodIndex(strings, [totals[x] for x in strings])
+            phase.add('strings', len(strings))
+        self._neighbourhood_indexes[key] = index
+        return index
+
+    def lemma_array(self, field):
+        '''
+        NumPy array of the values of a numeric lemma field (frequencies,
+        booleans, or the integer code of ClassNum), indexed by IdNum;
+        element 0 is unused. For example, the total noun frequency:
+
+        >>> cob = clx.lemma_array('Cob')
+        >>> cob[clx.lemma_array('ClassNum') == clx.class_num('noun')].sum()
+        '''
+        if ('lemma', field) not in self._arrays:
+            self._require_lemmas([field])
+            self._arrays['lemma', field] = _numeric_column(
+                self._lemmas, CelexLemma, field)
+        return self._arrays['lemma', field]
+
+    def wordform_array(self, field):
+        '''
+        Same as lemma_array for wordform fields. wordform_array('IdNumLemma')
+        maps each wordform to its lemma, so lemma arrays can be indexed with
+        it, and wordform values can be summed by lemma with np.bincount (see
+        sum_by_lemma).
+        '''
+        if ('wordform', field) not in self._arrays:
+            self._require_wordforms([field])
+            self._arrays['wordform', field] = _numeric_column(
+                self._wordforms, CelexWordform, field)
+        return self._arrays['wordform', field]
+
+    def sum_by_lemma(self, field):
+        '''
+        Sum of a numeric wordform field over the wordforms of each lemma,
+        indexed by lemma IdNum
+        '''
+        self.load_lemmas()
+        return np.bincount(self.wordform_array('IdNumLemma'),
+                           self.wordform_array(field),
+                           minlength=len(self._lemmas) + 1)
+
+    def lemma_ids(self, x):
+        '''
+        IdNums of the lemmas whose headword is x (empty if there are none)
+        '''
+        self.load_lemmas()
+        if x not in self._lemma_lookup:
+            return []
+        return _lookup_ids(self._lemma_lookup, x)
+
+    def wordform_ids(self, x):
+        self.load_wordforms()
+        if x not in self._wf_lookup:
+            return []
+        return _lookup_ids(self._wf_lookup, x)
+
+    def lemma_ids_many(self, xs):
+        '''
+        Batch version of lemma_ids: returns the IdNums of the lemmas whose
+        headword is each of the strings in xs, concatenated into one array,
+        and an array with the index in xs that each IdNum belongs to
+        '''
+        self.load_lemmas()
+        return _lookup_id_groups(self._lemma_lookup, xs)
+
+    def wordform_ids_many(self, xs):
+        self.load_wordforms()
+        return _lookup_id_groups(self._wf_lookup, xs)
+
+    @staticmethod
+    def class_num(pos):
+        '''
+        Integer code of a part of speech name in the ClassNum arrays
+        '''
+        for code, name in field_keys['ClassNum'].items():
+            if name == pos:
+                return code
+        raise ValueError('Unknown part of speech "%s"' % pos)
+
+    def record_cache_info(self):
+        '''
+        Hit and miss statistics of the record cache (see Celex.__init__)
+        '''
+        return self._record_cache.info()
+
+    def clear_record_cache(self):
+        self._record_cache.clear()
 
     def lemma_to_wordforms(self, lemma):
         '''
@@ -535,5 +1264,7 @@ class Celex(object):
         corresponding to each of the wordforms connected to the lemma
         '''
         self.map_lemmas_to_wordforms()
-        return [self.wordform_by_id(wf_id) for wf_id in 
-                self._lemmas_to_wordforms[lemma.IdNum - 1]]
+        offsets, wf_ids = self._lemmas_to_wordforms
+        start, end = offsets[lemma.IdNum - 1:lemma.IdNum + 1]
+        return [self.wordform_by_id(wf_id) for wf_id in
+                wf_ids[start:end].tolist()]
@@ -0,0 +1,108 @@
+# License: BSD (3-clause)
+
+'''
+Entropy and divergences of many discrete distributions at once. The
+distributions are packed like the rows of a CSR matrix: the values of all
+of them are concatenated into one array, and offsets[i]:offsets[i + 1] is
+the slice that holds distribution i (so there are len(offsets) - 1 of
+them). Distributions that are compared to each other (p and q) are packed
+into two arrays of the same length, aligned element by element.
+
+All logarithms are base 2. By convention 0 * log(0) = 0; a divergence is
+infinite if q is 0 where p isn't.
+
+smooth: added to every value before normalizing (flat, or "add-k",
+    smoothing)
+
+normalize: if True (default), the values of each distribution are
+    divided by their sum, so they can be raw counts; distributions that
+    sum to 0 then come back as NaN. If False, the values are used as
+    probabilities as they are.
+'''
+
+import collections
+
+import numpy as np
+
+Divergences = collections.namedtuple(
+    'Divergences', ['entropy', 'cross_entropy', 'kl', 'js'])
+
+
+def group_offsets(owners, n):
+    '''
+    Offsets for values sorted by owner, where owners[j] is the index of the
+    distribution (out of n) that value j belongs to
+    '''
+    offsets = np.zeros(n + 1, np.int64)
+    np.cumsum(np.bincount(owners, minlength=n), out=offsets[1:])
+    return offsets
+
+
+def _owners(offsets):
+    offsets = np.asarray(offsets, np.int64)
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _prepare(values, owners, n, smooth, normalize):
+    values = np.asarray(values, float) + smooth
+    totals = np.bincount(owners, values, minlength=n)
+    if normalize:
+        values = values / np.where(totals == 0, 1, totals)[owners]
+    return values, totals == 0
+
+
+def _plogq(p, q):
+    # p * log2(q), with 0 * log2(q) = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(p > 0, p * np.log2(np.where(p > 0, q, 1)), 0.)
+
+
+def _sums(owners, n, terms, empty, normalize):
+    result = np.bincount(owners, terms, minlength=n).astype(float)
+    if normalize:
+        result[empty] = np.nan
+    return result
+
+
+def entropies(values, offsets, smooth=0, normalize=True):
+    '''
+    Entropy of each distribution
+    '''
+    owners = _owners(offsets)
+    n = len(offsets) - 1
+    p, empty = _prepare(values, owners, n, smooth, normalize)
+    return -_sums(owners, n, _plogq(p, p), empty, normalize)
+
+
+def divergences(p, q, offsets, smooth=0, normalize=True):
+    '''
+    Returns a Divergences tuple with arrays of the entropy of each p, the
+    cross-entropy of p relative to q, the Kullback-Leibler divergence of q
+    from p, D(p || q), and the Jensen-Shannon divergence of p and q
+    '''
+    owners = _owners(offsets)
+    n = len(offsets) - 1
+    p, p_empty = _prepare(p, owners, n, smooth, normalize)
+    q, q_empty = _prepare(q, owners, n, smooth, normalize)
+    empty = p_empty | q_empty
+    p_log_p = _plogq(p, p)
+    p_log_q = _plogq(p, q)
+    m = (p + q) / 2
+    js_terms = (p_log_p - _plogq(p, m) + _plogq(q, q) - _plogq(q, m)) / 2
+    entropy = -_sums(owners, n, p_log_p, p_empty, normalize)
+    cross_entropy = -_sums(owners, n, p_log_q, empty, normalize)
+    kl = _sums(owners, n, p_log_p - p_log_q, empty, normalize)
+    js = _sums(owners, n, js_terms, empty, normalize)
+    return Divergences(entropy, cross_entropy, kl, js)
+
+
+def cross_entropies(p, q, offsets, smooth=0, normalize=True):
+    return divergences(p, q, offsets, smooth, normalize).cross_entropy
+
+
+def kl_divergences(p, q, offsets, smooth=0, normalize=True):
+    return divergences(p, q, offsets, smooth, normalize).kl
+
+
+def js_divergences(p, q, offsets, smooth=0, normalize=True):
+    return divergences(p, q, offsets, smooth, normalize).js
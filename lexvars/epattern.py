@@ -0,0 +1,174 @@
+# License: BSD (3-clause)
+
+'''
+Streaming reader for the #S(EPATTERN ...) records of VALEX .lex files:
+
+#S(EPATTERN :TARGET |abandon| :SUBCAT (VSUBCAT NP)
+ :CLASSES (24 4140) :RELFREQ 0.4957 :FREQCNT 176 ...)
+
+The file is read (and decompressed, for .bz2 files) in chunks, and each
+record is parsed as soon as all of it has been read, in a single pass: the
+record is cut at its top-level :KEYWORD markers outside |symbols| and
+"strings", using the balance of parentheses (also outside them) to skip
+keywords that are nested in a value. Each record is returned as a
+dictionary from the lowercased keyword (target, subcat, classes, relfreq,
+...) to the raw text of its value, which parse_value turns into nested
+lists of atoms.
+
+Valex.read_lex_file only needs the frame and its frequencies, which
+iter_frames finds with a few string searches in each record. Unlike a
+regular expression over the whole file, a search never runs past the end
+of its record.
+'''
+
+import bz2
+import re
+
+record_start = '#S(EPATTERN'
+keyword_regexp = re.compile(r':([A-Za-z][A-Za-z0-9-]*)\s+')
+quoted_regexp = re.compile(r'\|[^|]*\||"(?:[^"\\]|\\.)*"')
+token_regexp = re.compile(r'[()]|\|[^|]*\||"(?:[^"\\]|\\.)*"|[^\s()|"]+')
+classes_regexp = re.compile(r'CLASSES \((\d+) (\d+)\)')
+digits_regexp = re.compile(r'\d*')
+
+
+def open_lex(filename):
+    '''
+    File object for a .lex or .lex.bz2 file, decompressed as it is read
+    '''
+    if filename.endswith('.bz2'):
+        return bz2.BZ2File(filename)
+    return open(filename, 'rb')
+
+
+def _mask(match):
+    return 'x' * len(match.group())
+
+
+def parse_record(text):
+    '''
+    Dictionary of the fields of a record, given its text after
+    "#S(EPATTERN"
+    '''
+    text = text.rstrip()
+    # Keywords and parentheses are found in a copy of the text in which
+    # |symbols| and "strings" are blanked out (of the same length, so that
+    # positions in it are positions in the text); quoted parentheses can
+    # cancel out, so the copy is needed whenever there are any quotes
+    counted = text
+    if '|' in text or '"' in text:
+        counted = quoted_regexp.sub(_mask, text)
+    balance = counted.count('(') - counted.count(')')
+    # Drop the parenthesis that closes the record
+    if balance < 0 and counted.endswith(')'):
+        text = text[:-1]
+    fields = {}
+    name = None
+    start = 0
+    depth = 0
+    last = 0
+    for match in keyword_regexp.finditer(counted, 0, len(text)):
+        position = match.start()
+        if position > 0 and not counted[position - 1].isspace():
+            continue
+        depth += counted.count('(', last, position) - \
+            counted.count(')', last, position)
+        last = position
+        if depth != 0:
+            continue
+        if name is not None:
+            fields[name] = text[start:match.start()].strip()
+        name = match.group(1).lower()
+        start = match.end()
+    if name is not None:
+        fields[name] = text[start:].strip()
+    return fields
+
+
+def iter_record_texts(f, chunk_size=1 << 20):
+    '''
+    Generator over the text of each record of a file object (see
+    open_lex), after "#S(EPATTERN"
+    '''
+    pending = ''
+    while True:
+        chunk = f.read(chunk_size)
+        pending += chunk
+        parts = pending.split(record_start)
+        # parts[0] is whatever precedes the first record
+        if chunk:
+            # The last record may continue in the next chunk
+            pending = record_start + parts.pop() if len(parts) > 1 \
+                else pending
+        for part in parts[1:]:
+            yield part
+        if not chunk:
+            return
+
+
+def iter_records(f, chunk_size=1 << 20):
+    '''
+    Generator over the records of a file object, as dictionaries of fields
+    (see parse_record)
+    '''
+    for text in iter_record_texts(f, chunk_size):
+        yield parse_record(text)
+
+
+def iter_frames(f, chunk_size=1 << 20):
+    '''
+    Generator over the frame, class, classfreq, relfreq and freqcnt of each
+    record of a file object, as the dictionaries in Valex.verbs, skipping
+    records that lack any of them. This doesn't parse the other fields.
+    '''
+    for text in iter_record_texts(f, chunk_size):
+        frame = record_frame(text)
+        if frame is not None:
+            yield frame
+
+
+def parse_value(text):
+    '''
+    A field value as a string (for an atom) or a nested list of values
+    '''
+    stack = [[]]
+    for token in token_regexp.findall(text):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) > 1:
+                value = stack.pop()
+                stack[-1].append(value)
+        else:
+            stack[-1].append(token)
+    while len(stack) > 1:
+        value = stack.pop()
+        stack[-1].append(value)
+    values = stack[0]
+    return values[0] if len(values) == 1 else values
+
+
+def record_frame(text):
+    '''
+    The frame, class, classfreq, relfreq and freqcnt of the text of a
+    record (see iter_frames), or None. The fields are found in this order:
+    the frame is the text between "(VSUBCAT " and the next closing
+    parenthesis, followed by "CLASSES (class classfreq)", "RELFREQ
+    relfreq :FREQCNT " and the digits of freqcnt.
+    '''
+    i = text.find('(VSUBCAT ')
+    j = text.find(')', i)
+    if i < 0 or j < 0:
+        return None
+    classes = classes_regexp.search(text, j)
+    if classes is None:
+        return None
+    k = text.find('RELFREQ ', classes.end())
+    m = text.find(' :FREQCNT ', k)
+    if k < 0 or m < 0:
+        return None
+    freqcnt = digits_regexp.match(text, m + len(' :FREQCNT ')).group()
+    return {'frame': text[i + len('(VSUBCAT '):j],
+            'class': classes.group(1), 'classfreq': classes.group(2),
+            'relfreq': float(text[k + len('RELFREQ '):m]),
+            'freqcnt': int(freqcnt)}
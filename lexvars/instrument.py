@@ -0,0 +1,159 @@
+# License: BSD (3-clause)
+
+'''
+Opt-in timers and counters for the loading and computation phases of
+Celex, LexVars, Valex and BNCWordVecs. Nothing is recorded unless
+instrumentation is enabled:
+
+>> import lexvars.instrument as instrument
+>> instrument.enable()
+>> clx.load_lemmas()
+>> instrument.print_report()
+phase                            calls   seconds   RSS MB  counts
+celex.index                          1     0.412    962.0  rows 52447 (127303/s)
+celex.join                           1     0.937    948.4  rows 52447 (55973/s)
+celex.load.lemmas                    1     9.081   1081.3
+celex.read_db.efl                    1     1.263    301.7  rows 52447 (41526/s)
+...
+peak RSS: 1081.3 MB
+
+Phases can be nested (celex.load.lemmas includes the time of the
+celex.read_db phases, for example), so the times don't add up to the
+total. report() returns the same information as a list of dictionaries,
+and add_hook registers a function that is called with a dictionary for
+every phase as soon as it ends, e.g. to send it to a logger:
+
+>> instrument.add_hook(lambda event: logger.info(json.dumps(event)))
+'''
+
+import resource
+import sys
+import time
+
+_enabled = False
+_stats = {}
+_hooks = []
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    '''
+    Forget everything recorded so far
+    '''
+    _stats.clear()
+
+
+def add_hook(hook):
+    '''
+    hook is called with a dictionary with the keys phase, seconds, counts
+    (a dictionary of counter names to numbers) and peak_rss_mb, whenever a
+    phase ends while instrumentation is enabled
+    '''
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+class _Phase(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+
+    def add(self, counter, n=1):
+        '''
+        Add n to one of the counters of the phase (rows, tokens, files...)
+        '''
+        self.counts[counter] = self.counts.get(counter, 0) + n
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.time() - self.start
+        rss = peak_rss_mb()
+        stats = _stats.setdefault(self.name, {'calls': 0, 'seconds': 0.,
+                                              'counts': {}})
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['peak_rss_mb'] = rss
+        for counter, n in self.counts.items():
+            stats['counts'][counter] = stats['counts'].get(counter, 0) + n
+        if _hooks:
+            event = {'phase': self.name, 'seconds': seconds,
+                     'counts': self.counts, 'peak_rss_mb': rss}
+            for hook in _hooks:
+                hook(event)
+
+
+class _NullPhase(object):
+
+    def add(self, counter, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_phase = _NullPhase()
+
+
+def phase(name):
+    '''
+    Context manager that times the code in its block as one call of the
+    named phase; the object it returns has an add method for counters
+    '''
+    return _Phase(name) if _enabled else _null_phase
+
+
+def report():
+    '''
+    List of dictionaries with the phase name, number of calls, total
+    seconds, counts, rates (each counter per second) and the peak RSS of
+    the process at the end of its last call, for each phase, sorted by name
+    '''
+    result = []
+    for name in sorted(_stats):
+        stats = _stats[name]
+        rates = {}
+        if stats['seconds'] > 0:
+            rates = dict((counter, n / stats['seconds'])
+                         for counter, n in stats['counts'].items())
+        result.append({'phase': name, 'calls': stats['calls'],
+                       'seconds': stats['seconds'],
+                       'counts': dict(stats['counts']), 'rates': rates,
+                       'peak_rss_mb': stats['peak_rss_mb']})
+    return result
+
+
+def print_report(f=sys.stdout):
+    print >> f, '%-32s %5s %9s %8s  %s' % ('phase', 'calls', 'seconds',
+                                           'RSS MB', 'counts')
+    for entry in report():
+        counts = ', '.join('%s %d (%.0f/s)' % (counter, n,
+                                               entry['rates'].get(counter, 0))
+                           for counter, n in sorted(entry['counts'].items()))
+        print >> f, '%-32s %5d %9.3f %8.1f  %s' % (
+            entry['phase'], entry['calls'], entry['seconds'],
+            entry['peak_rss_mb'], counts)
+    print >> f, 'peak RSS: %.1f MB' % peak_rss_mb()
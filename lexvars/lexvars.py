@@ -2,14 +2,65 @@
 # 2011-2014
 # License: BSD (3-clause)
 
-import __builtin__
 import collections
 import itertools
 import os
 
 import numpy as np
+import scipy.sparse
 
-from celex import Celex
+import instrument
+from celex import Celex, field_keys, strip_disc
+from entropy import entropies, group_offsets
+from synsets import SynsetTable, wordnet_version
+
+
+# Cells of the inflectional paradigms (see LexVars.inflectional_entropy)
+common_cells = ['noun_plural', 'third_sg', 'part_ing', 'part_ed',
+                'past_tense', 'comparative', 'superlative']
+bare_cells = ['bare_noun', 'bare_verb', 'positive', 'headword_form']
+
+
+# Groupings of the paradigm cells for each kind of inflectional entropy: a
+# list of (name, cells) pairs, and the names that are part of the
+# distribution even if the lemma has no wordforms in any of their cells
+inflection_paradigms = {
+    'separate_bare': ([(x, [x]) for x in bare_cells + common_cells], []),
+    'collapsed_bare': ([('bare', bare_cells)] +
+                       [(x, [x]) for x in common_cells], ['bare']),
+    'no_bare': ([(x, [x]) for x in common_cells], [])
+}
+
+
+def inflection_cell(infl):
+    '''
+    The paradigm cell of a wordform given its decoded FlectType, or None if
+    it doesn't belong to any of the cells
+    '''
+    if (infl[:1] == ['present_tense'] and infl[1:2] != ['3rd_person_verb']
+        or infl[:1] == ['infinitive']):
+        return 'bare_verb'
+    if infl[:1] == ['singular']:
+        return 'bare_noun'
+    if infl[:1] == ['plural']:
+        return 'noun_plural'
+    if infl[:1] == ['past_tense']:
+        return 'past_tense'
+    if infl == ['positive']:
+        return 'positive'
+    if infl == ['comparative']:
+        return 'comparative'
+    if infl == ['superlative']:
+        return 'superlative'
+    if infl == ['headword_form']:
+        return 'headword_form'
+    if infl == ['present_tense', '3rd_person_verb', 'singular']:
+        return 'third_sg'
+    if infl == ['participle', 'present_tense']:
+        return 'part_ing'
+    if infl == ['participle', 'past_tense']:
+        return 'part_ed'
+    return None
 
 
 class LexVars(object):
@@ -21,19 +72,48 @@ class LexVars(object):
     lv.inflectional_entropy('shoe')
     '''
 
-    def __init__(self, clx):
+    def __init__(self, clx, synset_table=None):
+        '''
+        synset_table: the SynsetTable used by wordnet_synsets (by default,
+            the one in the Celex cache, see synset_table)
+        '''
         self.clx = clx
+        self._synset_table = synset_table
         self._derivational_families = {}
+        self._inflection_matrix = None
 
-    def wordnet_synsets(self, word):
+    def synset_table(self):
+        '''
+        The SynsetTable of wordnet_synsets. It is built from WordNet the
+        first time it is needed, including all of the CELEX wordforms (this
+        takes a few minutes and requires NLTK), and saved in the Celex cache
+        directory (see Celex.cached_arrays), keyed by the CELEX wordform DB
+        and the WordNet version.
+        '''
+        if self._synset_table is None:
+            arrays, meta = self.clx.cached_arrays(
+                'wordnet-synsets', ['efw'],
+                lambda: SynsetTable.build_arrays(
+                    self.clx.wordform_column('Word')),
+                version=wordnet_version())
+            self._synset_table = SynsetTable(arrays, meta)
+        return self._synset_table
+
+    def wordnet_synsets(self, word, pos=None):
         '''
         Number of WordNet "synsets" (roughly, senses) for the given word.
         This variable collapses across different parts of speech, meanings,
-        etc.
+        etc., unless pos ('noun', 'verb', 'adjective' or 'adverb') is given.
+        Returns None if the word has no synsets.
         '''
-        from nltk.corpus import wordnet
-        synsets = wordnet.synsets(word)
-        return len(synsets) if len(synsets) > 0 else None
+        return self.synset_table().count(word, pos)
+
+    def wordnet_synset_counts(self, words, pos=None):
+        '''
+        Array of wordnet_synsets for each of the words (NaN for words that
+        have no synsets)
+        '''
+        return self.synset_table().counts(words, pos)
 
     def pos_freq(self, lemma, pos):
         '''
@@ -42,8 +122,32 @@ class LexVars(object):
         >>> lv.pos_freq('wind', 'noun')
         3089
         '''
-        lemmas = self.clx.lemma_lookup(lemma)
-        return sum(lemma.Cob for lemma in lemmas if lemma.ClassNum == pos)
+        ids = self.clx.lemma_ids(lemma)
+        if len(ids) == 0:
+            raise KeyError(lemma)
+        class_nums = self.clx.lemma_array('ClassNum')[ids]
+        cob = self.clx.lemma_array('Cob')[ids]
+        return int(cob[class_nums == self.clx.class_num(pos)].sum())
+
+    def _lemma_groups(self, lemmas):
+        # The IdNums of the lemmas with each of the given headwords (see
+        # Celex.lemma_ids_many), and a mask of the headwords found in CELEX
+        ids, owners = self.clx.lemma_ids_many(lemmas)
+        found = np.bincount(owners, minlength=len(lemmas)) > 0
+        return ids, owners, found
+
+    def pos_freqs(self, lemmas, pos):
+        '''
+        Array of pos_freq for each of the lemmas (NaN for lemmas that are
+        not in CELEX)
+        '''
+        ids, owners, found = self._lemma_groups(lemmas)
+        class_nums = self.clx.lemma_array('ClassNum')[ids]
+        cob = self.clx.lemma_array('Cob')[ids]
+        cob = cob * (class_nums == self.clx.class_num(pos))
+        result = np.bincount(owners, cob, minlength=len(lemmas)).astype(float)
+        result[~found] = np.nan
+        return result
 
     def _smoothed_log_ratio(self, a, b):
         return np.log2((a + 1.) / (b + 1.))
@@ -51,7 +155,15 @@ class LexVars(object):
     def log_noun_to_verb_ratio(self, lemma):
         noun_freq = self.pos_freq(lemma, 'noun')
         verb_freq = self.pos_freq(lemma, 'verb')
-        return _smoothed_log_ratio(noun_freq, verb_freq)
+        return self._smoothed_log_ratio(noun_freq, verb_freq)
+
+    def log_noun_to_verb_ratios(self, lemmas):
+        '''
+        Array of log_noun_to_verb_ratio for each of the lemmas (NaN for
+        lemmas that are not in CELEX)
+        '''
+        return self._smoothed_log_ratio(self.pos_freqs(lemmas, 'noun'),
+                                        self.pos_freqs(lemmas, 'verb'))
 
     def derivational_family(self, target, right=False, 
                             include_multiword=False):
@@ -65,35 +177,214 @@ class LexVars(object):
         "beauty-sleep" are ignored, but "oversleep" and "sleepwalk" are
         included.
         '''
-        families = self._get_derivational_families(right, include_multiword)
-        family = families[target]
+        family = self._family_ids(target, right, include_multiword)
         return [self.clx.lemma_by_id(x) for x in family]
 
     def derivational_entropy(self, target, right=False, smooth=1,
                              include_multiword=False):
-        families = self._get_derivational_families(right, include_multiword)
-        frequencies = []
-        for family_member_id in families[target]:
-            frequencies.append(self.clx._lemmas[family_member_id]['Cob'])
-        return self.entropy(frequencies, smooth)
-
-    def _get_derivational_families(self, right, include_multiword):
-        self.clx.load_lemmas()
+        family = self._family_ids(target, right, include_multiword)
+        cob = self.clx.lemma_array('Cob')
+        return self.entropy(cob[family], smooth)
+
+    def derivational_matrix(self, right=False, include_multiword=False):
+        '''
+        The derivational families (see derivational_family) as a sparse
+        (scipy.sparse CSR) incidence matrix, with a row for each morpheme
+        and a column for each lemma IdNum (column 0 is unused). Returns
+        (morphemes, matrix), where morphemes is a sorted array of the row
+        labels.
+
+        The matrix is built from the CELEX morphology DB once and saved in
+        the Celex cache directory (see Celex.cached_arrays).
+        '''
         key = (right, include_multiword)
-        families = self._derivational_families.setdefault(key, {})
-        if families == {}:
-            for lemma_id, lemma in enumerate(self.clx._lemmas):
-                multiword = '-' in lemma['Head'] or ' ' in lemma['Head']
-                if multiword and not include_multiword:
-                    continue
-                for parse in lemma['Parses']:
-                    morphemes = parse['Imm'].split('+')
-                    if right:
-                        morphemes = morphemes[:1]
-                    for morpheme in morphemes:
-                        entry = families.setdefault(morpheme, set())
-                        entry.add(lemma_id + 1)
-        return families
+        if key not in self._derivational_families:
+            with instrument.phase('lexvars.derivational_matrix'):
+                arrays, meta = self.clx.cached_arrays(
+                    'families-%d%d' % key, ['eml'],
+                    lambda: self._build_derivational_matrix(*key))
+            indices = arrays['indices']
+            matrix = scipy.sparse.csr_matrix(
+                (np.ones(len(indices)), indices, arrays['indptr']),
+                tuple(meta['shape']))
+            self._derivational_families[key] = arrays['morphemes'], matrix
+        return self._derivational_families[key]
+
+    def _build_derivational_matrix(self, right, include_multiword):
+        pairs = set()
+        heads = self.clx.lemma_column('Head')
+        for lemma_id, (head, parses) in enumerate(
+                zip(heads, self.clx.lemma_parses('Imm'))):
+            multiword = '-' in head or ' ' in head
+            if multiword and not include_multiword:
+                continue
+            for parse in parses:
+                morphemes = parse.split('+')
+                if right:
+                    morphemes = morphemes[:1]
+                for morpheme in morphemes:
+                    pairs.add((morpheme, lemma_id + 1))
+        pairs = sorted(pairs)
+        morphemes = sorted(set(x[0] for x in pairs))
+        counts = collections.Counter(x[0] for x in pairs)
+        indptr = np.zeros(len(morphemes) + 1, np.int64)
+        np.cumsum([counts[x] for x in morphemes], out=indptr[1:])
+        arrays = {'morphemes': np.array(morphemes, str),
+                  'indices': np.array([x[1] for x in pairs], np.int64),
+                  'indptr': indptr}
+        return arrays, {'shape': [len(morphemes), len(heads) + 1]}
+
+    def _morpheme_rows(self, targets, right, include_multiword):
+        # Row of each target in derivational_matrix (-1 if it has no family)
+        morphemes, matrix = self.derivational_matrix(right, include_multiword)
+        targets = np.array(targets, str)
+        if len(morphemes) == 0:
+            return np.zeros(len(targets), np.int64) - 1
+        rows = np.searchsorted(morphemes, targets)
+        rows[rows == len(morphemes)] = 0
+        rows[morphemes[rows] != targets] = -1
+        return rows
+
+    def _family_ids(self, target, right, include_multiword):
+        row, = self._morpheme_rows([target], right, include_multiword)
+        if row < 0:
+            raise KeyError(target)
+        matrix = self.derivational_matrix(right, include_multiword)[1]
+        return matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+
+    def derivational_family_sizes(self, targets, right=False,
+                                  include_multiword=False):
+        '''
+        Array of the number of lemmas in the derivational family of each of
+        the targets (NaN for morphemes that have no derivational family)
+        '''
+        morphemes, matrix = self.derivational_matrix(right, include_multiword)
+        sizes = matrix * np.ones(matrix.shape[1])
+        return self._by_morpheme(sizes, targets, right, include_multiword)
+
+    def derivational_entropies(self, targets, right=False, smooth=1,
+                               include_multiword=False):
+        '''
+        Array of derivational_entropy for each of the targets (NaN for
+        morphemes that have no derivational family). The rows of
+        derivational_matrix are the packed distributions that
+        entropy.entropies takes, so the entropies of all of the families
+        are computed in one pass.
+        '''
+        morphemes, matrix = self.derivational_matrix(right, include_multiword)
+        cob = self.clx.lemma_array('Cob')
+        result = entropies(cob[matrix.indices], matrix.indptr, smooth)
+        # As in entropy, a distribution that sums to 0 has entropy -1
+        result[np.isnan(result)] = -1
+        return self._by_morpheme(result, targets, right, include_multiword)
+
+    def _by_morpheme(self, values, targets, right, include_multiword):
+        rows = self._morpheme_rows(targets, right, include_multiword)
+        result = np.zeros(len(rows)) + np.nan
+        result[rows >= 0] = values[rows[rows >= 0]]
+        return result
+
+    def orthographic_index(self, lexicon='wordforms', include_multiword=False):
+        '''
+        NeighbourhoodIndex over the spellings of the CELEX wordforms (or of
+        the lemma headwords, if lexicon is 'lemmas'); see
+        Celex.neighbourhood_index
+
+        include_multiword: see derivational_family
+        '''
+        return self.clx.neighbourhood_index('orthographic', lexicon,
+                                            include_multiword)
+
+    def phonological_index(self, lexicon='wordforms', include_multiword=False):
+        '''
+        NeighbourhoodIndex over the stress-stripped DISC transcriptions of
+        the CELEX wordforms or lemmas; see Celex.neighbourhood_index
+        '''
+        return self.clx.neighbourhood_index('phonological', lexicon,
+                                            include_multiword)
+
+    def coltheart_n(self, word, lexicon='wordforms'):
+        '''
+        Number of words that differ from the given word in exactly one
+        letter (Coltheart et al., 1977). The word doesn't need to be in
+        CELEX, so this also works for nonwords.
+
+        Coltheart, M., Davelaar, E., Jonasson, J. T., & Besner, D. (1977).
+        Access to the internal lexicon. In S. Dornic (Ed.), Attention and
+        Performance VI (pp. 535-555).
+        '''
+        index = self.orthographic_index(lexicon)
+        return len(index.substitution_neighbours(word))
+
+    def frequency_weighted_n(self, word, log=False, lexicon='wordforms'):
+        '''
+        Total COBUILD frequency of the Coltheart neighbours of the word (see
+        coltheart_n); if log is True, the sum of log10(1 + frequency)
+        '''
+        index = self.orthographic_index(lexicon)
+        freqs = index.frequencies[index.substitution_neighbours(word)]
+        if log:
+            freqs = np.log10(1. + freqs)
+        return freqs.sum()
+
+    def old20(self, word, n=20, lexicon='wordforms'):
+        '''
+        Mean Levenshtein distance from the word to its n closest words
+        (Yarkoni et al., 2008).
+
+        Yarkoni, T., Balota, D., & Yap, M. (2008). Moving beyond Coltheart's
+        N: A new measure of orthographic similarity. Psychonomic Bulletin &
+        Review, 15(5), 971-979.
+        '''
+        distances, ids = self.orthographic_index(lexicon).nearest(word, n)
+        return distances.mean()
+
+    def _transcription(self, word, disc, lexicon):
+        if disc:
+            return strip_disc(word)
+        if lexicon == 'wordforms':
+            records = self.clx.wordform_lookup(word)
+        else:
+            records = self.clx.lemma_lookup(word)
+        for record in records:
+            if len(record.Prons) > 0:
+                return strip_disc(record.Prons[0].PhonStrsDISC)
+        raise KeyError(word)
+
+    def phonological_density(self, word, disc=False, lexicon='wordforms'):
+        '''
+        Number of words whose pronunciation differs from that of the given
+        word by adding, deleting or substituting one phoneme (Luce &
+        Pisoni, 1998). Stress and syllable boundaries are ignored, and
+        homophones of the word are not counted.
+
+        disc: if True, word is a DISC transcription rather than a spelling
+            (e.g. for nonwords); otherwise the primary CELEX pronunciation
+            of the first entry spelled that way is used
+
+        Luce, P. A., & Pisoni, D. B. (1998). Recognizing spoken words: The
+        neighborhood activation model. Ear and Hearing, 19(1), 1-36.
+        '''
+        transcription = self._transcription(word, disc, lexicon)
+        distances, ids = self.phonological_index(lexicon).within(
+            transcription, 1)
+        return len(ids)
+
+    def pld20(self, word, n=20, disc=False, lexicon='wordforms'):
+        '''
+        Mean Levenshtein distance, in phonemes, from the pronunciation of
+        the word to the n closest pronunciations in the lexicon (the
+        phonological counterpart of old20; Yap & Balota, 2009). disc: see
+        phonological_density
+
+        Yap, M. J., & Balota, D. A. (2009). Visual word recognition of
+        multisyllabic words. Journal of Memory and Language, 60(4),
+        502-529.
+        '''
+        transcription = self._transcription(word, disc, lexicon)
+        distances, ids = self.phonological_index(lexicon).nearest(
+            transcription, n)
+        return distances.mean()
 
     def inflectional_entropy(self, lemma, kind='separate_bare', smooth=1,
                              verbose=False):
@@ -137,60 +428,114 @@ class LexVars(object):
 
         aches (plural), aches (3rd singular present),
         aching (participle), ached (past tense), ached (participles)
-        '''
-        self.clx.map_lemmas_to_wordforms()
-
-        clx_lemmas = self.clx.lemma_lookup(lemma)
-        # Use __builtin__ here in case sum is overshadowed by numpy
-        all_wordforms = __builtin__.sum((self.clx.lemma_to_wordforms(clx_lemma) 
-                                         for clx_lemma in clx_lemmas), [])
-
-        counter = collections.Counter()
-
-        for wf in all_wordforms:
-            infl = wf.FlectType
-            freq = wf.Cob
-            if (infl[0] == 'present_tense' and infl[1] != '3rd_person_verb' 
-                or infl[0] == 'infinitive'):
-                counter['bare_verb'] += freq
-            if infl[0] == 'singular':
-                counter['bare_noun'] += freq
-            if infl[0] == 'plural':
-                counter['noun_plural'] += freq
-            if infl[0] == 'past_tense':
-                counter['past_tense'] += freq
-            if infl == ['positive']:
-                counter['positive'] += freq
-            if infl == ['comparative']:
-                counter['comparative'] += freq
-            if infl == ['superlative']:
-                counter['superlative'] += freq
-            if infl == ['headword_form']:
-                counter['headword_form'] += freq
-            if infl == ['present_tense', '3rd_person_verb', 'singular']:
-                counter['third_sg'] += freq
-            if infl == ['participle', 'present_tense']:
-                counter['part_ing'] += freq
-            if infl == ['participle', 'past_tense']:
-                counter['part_ed'] += freq
-
-        common = ['noun_plural', 'third_sg', 'part_ing', 'part_ed', 
-                  'past_tense', 'comparative', 'superlative']
-        bare = ['bare_noun', 'bare_verb', 'positive', 'headword_form']
-        common_freqs = [counter[i] for i in common if i in counter]
-        bare_freqs = [counter[i] for i in bare if i in counter]
 
+        Instead of one of these names, kind can be a custom grouping of the
+        cells in bare_cells and common_cells, as a list of (name, cells)
+        pairs; for example, to lump the two participles together:
+
+        [('participle', ['part_ing', 'part_ed']), ('past_tense',
+          ['past_tense']), ('third_sg', ['third_sg'])]
+
+        Only the groups in which the lemma has wordforms are part of the
+        distribution (except for the bare group of collapsed_bare, which
+        always is). See inflectional_entropies for many lemmas at once.
+        '''
+        if len(self.clx.lemma_ids(lemma)) == 0:
+            raise KeyError(lemma)
         if verbose:
-            print counter
-
-        if kind == 'separate_bare':
-            return self.entropy(bare_freqs + common_freqs, smooth)
-        elif kind == 'collapsed_bare':
-            return self.entropy([sum(bare_freqs)] + common_freqs, smooth)
-        elif kind == 'no_bare':
-            return self.entropy(common_freqs, smooth)
+            freqs, counts = self._paradigm_distributions([lemma], kind)
+            names = [name for name, cells in self._paradigm(kind)[0]]
+            print dict((name, freqs[0, j]) for j, name in enumerate(names)
+                       if counts[0, j] > 0)
+        return self.inflectional_entropies([lemma], kind, smooth)[0]
+
+    def inflection_matrix(self):
+        '''
+        Sparse (scipy.sparse CSR) matrices with a row for each lemma IdNum
+        (row 0 is unused) and a column for each of the cells in bare_cells +
+        common_cells: the total COBUILD frequency of the wordforms of the
+        lemma in the cell, and the number of those wordforms. Built on first
+        use.
+        '''
+        if self._inflection_matrix is None:
+            with instrument.phase('lexvars.inflection_matrix'):
+                self._inflection_matrix = self._build_inflection_matrix()
+        return self._inflection_matrix
+
+    def _build_inflection_matrix(self):
+        cells = bare_cells + common_cells
+        flect_types = self.clx.wordform_column('FlectType')
+        codes = {}
+        for raw in set(flect_types):
+            infl = [field_keys['FlectType'][x] for x in raw]
+            cell = inflection_cell(infl)
+            codes[raw] = -1 if cell is None else cells.index(cell)
+        wordform_cells = np.array([codes[x] for x in flect_types], np.int64)
+        in_cell = wordform_cells >= 0
+        rows = self.clx.wordform_array('IdNumLemma')[1:][in_cell]
+        cols = wordform_cells[in_cell]
+        cob = self.clx.wordform_array('Cob')[1:][in_cell]
+        shape = (len(self.clx.lemma_array('Cob')), len(cells))
+        freqs = scipy.sparse.csr_matrix((cob.astype(float), (rows, cols)),
+                                        shape)
+        counts = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                         shape)
+        return freqs, counts
+
+    def _paradigm(self, kind):
+        # (name, cells) pairs and always-present names of a kind of
+        # inflectional entropy, and the cell x group indicator matrix
+        if isinstance(kind, basestring):
+            if kind not in inflection_paradigms:
+                raise ValueError('Unknown inflectional entropy kind "%s"' %
+                                 kind)
+            groups, always = inflection_paradigms[kind]
         else:
-            raise ValueError('Unknown inflectional entropy kind "%s"' % kind)
+            groups, always = kind, []
+        cells = bare_cells + common_cells
+        rows = []
+        cols = []
+        for j, (name, members) in enumerate(groups):
+            for cell in members:
+                if cell not in cells:
+                    raise ValueError('Unknown inflection cell "%s"' % cell)
+                rows.append(cells.index(cell))
+                cols.append(j)
+        indicator = scipy.sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), (len(cells), len(groups)))
+        always = [j for j, (name, members) in enumerate(groups)
+                  if name in always]
+        return groups, always, indicator
+
+    def _paradigm_distributions(self, lemmas, kind):
+        # Total frequency and number of wordforms in each group of the
+        # paradigm for each headword (summing over the lemmas with that
+        # headword), as dense arrays
+        groups, always, indicator = self._paradigm(kind)
+        ids, owners, found = self._lemma_groups(lemmas)
+        freqs, counts = self.inflection_matrix()
+        headwords = scipy.sparse.csr_matrix(
+            (np.ones(len(ids)), (owners, ids)), (len(lemmas), freqs.shape[0]))
+        group_freqs = (headwords * freqs * indicator).toarray()
+        group_counts = (headwords * counts * indicator).toarray()
+        group_counts[:, always] = np.maximum(group_counts[:, always], 1)
+        return group_freqs, group_counts
+
+    def inflectional_entropies(self, lemmas, kind='separate_bare', smooth=1):
+        '''
+        Array of inflectional_entropy for each of the lemmas (NaN for lemmas
+        that are not in CELEX), computed for all of them at once from
+        inflection_matrix
+        '''
+        freqs, counts = self._paradigm_distributions(lemmas, kind)
+        rows, cols = np.nonzero(counts)
+        result = entropies(freqs[rows, cols], group_offsets(rows, len(lemmas)),
+                           smooth)
+        # As in entropy, a distribution that sums to 0 has entropy -1
+        result[np.isnan(result)] = -1
+        result[np.bincount(self.clx.lemma_ids_many(lemmas)[1],
+                           minlength=len(lemmas)) == 0] = np.nan
+        return result
 
     def entropy(self, freq_vec, smoothing_constant=1):
         '''
@@ -200,22 +545,12 @@ class LexVars(object):
         as plural ones, it's better to use [2, 1] as the "prior" instead of 
         [1, 1]).
         '''
-        vec = np.asarray(freq_vec, float) + smoothing_constant
-        if sum(vec) == 0:
-            return -1
-        probs = vec / sum(vec)
-        # Make sure we're not taking the log of 0 (by convention if p(x) = 0
-        # then p(x) * log(p(x)) = 0 in the definition of entropy)
-        probs[probs == 0] = 1
-        return -np.sum(probs * np.log2(probs))
+        result, = entropies(freq_vec, [0, len(freq_vec)], smoothing_constant)
+        return -1 if np.isnan(result) else result
 
 
 def test_all():
     clx = Celex(os.path.expanduser('~/Dropbox/celex_english'))
-    clx.load_lemmas()
-    clx.load_wordforms()
-    clx.map_lemmas_to_wordforms()
     lv = LexVars(clx)
-    unique_lemmas = set(x['Head'] for x in clx._lemmas)
-    for lemma in unique_lemmas:
-        lv.inflectional_entropy(lemma)
+    unique_lemmas = sorted(set(clx.lemma_column('Head')))
+    lv.inflectional_entropies(unique_lemmas)
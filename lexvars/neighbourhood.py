@@ -0,0 +1,210 @@
+# License: BSD (3-clause)
+
+import collections
+
+import numpy as np
+
+
+class NeighbourhoodIndex(object):
+    '''
+    Index over a list of strings (words or transcriptions) for neighbourhood
+    variables. It is built once and then answers each query without
+    comparing the query to the whole lexicon:
+
+    * Substitution neighbours (same length, one different character, as in
+      Coltheart's N): the hash of each string with one position replaced by
+      a wildcard is stored in a sorted array, so that the neighbours of a
+      query are found with one binary search per position.
+
+    * Levenshtein neighbours (as in OLD20): an inverted index from character
+      bigrams, including the word boundaries, to the strings that contain
+      them. Each edit changes at most two bigrams, so two strings within
+      distance k share at least max(len) + 1 - 2k bigrams; only strings that
+      pass this filter are compared to the query, using the bit-parallel
+      algorithm of Myers (1999) vectorized over all candidates. The n
+      nearest strings are found by increasing k until at least n strings are
+      within distance k.
+
+    Myers, G. (1999). A fast bit-vector algorithm for approximate string
+    matching based on dynamic programming. Journal of the ACM, 46(3),
+    395-415.
+    '''
+
+    wildcard = '\0'
+    # Bigram codes are first * 256 + second; the boundaries get codes 0 and
+    # 1 (a collision with a real character only makes the filter weaker)
+    start = 0
+    end = 1
+
+    def __init__(self, words, frequencies=None):
+        self.words = list(words)
+        if frequencies is None:
+            frequencies = np.ones(len(self.words))
+        self.frequencies = np.asarray(frequencies)
+        self.word_ids = dict((w, i) for i, w in enumerate(self.words))
+        self.lengths = np.array([len(w) for w in self.words], np.int64)
+        width = self.lengths.max() if len(self.words) > 0 else 0
+        self._codes = np.zeros((len(self.words), width), np.uint8)
+        for i, word in enumerate(self.words):
+            self._codes[i, :len(word)] = bytearray(word)
+        self._build_substitution_index()
+        self._build_bigram_index()
+
+    def _build_substitution_index(self):
+        hashes = []
+        ids = []
+        for i, word in enumerate(self.words):
+            for j in range(len(word)):
+                hashes.append(hash(word[:j] + self.wildcard + word[j + 1:]))
+                ids.append(i)
+        hashes = np.array(hashes, np.int64)
+        order = np.argsort(hashes, kind='mergesort')
+        self._sub_hashes = hashes[order]
+        self._sub_ids = np.array(ids, np.int64)[order]
+
+    def _build_bigram_index(self):
+        n, width = self._codes.shape
+        positions = np.arange(width + 2)
+        padded = np.zeros((n, width + 2), np.int64) + self.end
+        padded[:, 0] = self.start
+        padded[:, 1:width + 1] = self._codes
+        padded[positions[None, :] > self.lengths[:, None]] = self.end
+        bigrams = padded[:, :-1] * 256 + padded[:, 1:]
+        rows, cols = np.nonzero(positions[None, :-1] <= self.lengths[:, None])
+        keys, counts = np.unique(rows * 65536 + bigrams[rows, cols],
+                                 return_counts=True)
+        codes = keys % 65536
+        order = np.argsort(codes, kind='mergesort')
+        self._bigram_ids = keys[order] // 65536
+        self._bigram_counts = counts[order]
+        self._bigram_starts = np.searchsorted(codes[order], np.arange(65537))
+
+    def substitution_neighbours(self, word):
+        '''
+        Ids of the strings that have the same length as word and differ
+        from it in exactly one position
+        '''
+        found = set()
+        for j in range(len(word)):
+            h = hash(word[:j] + self.wildcard + word[j + 1:])
+            start = np.searchsorted(self._sub_hashes, h, 'left')
+            end = np.searchsorted(self._sub_hashes, h, 'right')
+            found.update(self._sub_ids[start:end].tolist())
+        # Drop hash collisions and the word itself
+        return sorted(i for i in found if _mismatches(self.words[i], word) == 1)
+
+    def shared_bigrams(self, word):
+        '''
+        Number of bigrams (counting repeated ones) that each string shares
+        with word
+        '''
+        codes = [self.start] + list(bytearray(word)) + [self.end]
+        counts = collections.Counter(a * 256 + b for a, b in
+                                     zip(codes[:-1], codes[1:]))
+        ids = []
+        weights = []
+        for bigram, count in counts.items():
+            start, end = self._bigram_starts[bigram:bigram + 2]
+            ids.append(self._bigram_ids[start:end])
+            weights.append(np.minimum(self._bigram_counts[start:end], count))
+        return np.bincount(np.concatenate(ids), np.concatenate(weights),
+                           minlength=len(self.words))
+
+    def distances(self, word, ids):
+        '''
+        Levenshtein distances from word to the strings with the given ids
+        '''
+        ids = np.asarray(ids, np.int64)
+        lengths = self.lengths[ids]
+        m = len(word)
+        if m == 0:
+            return lengths.copy()
+        if m > 64:
+            return np.array([levenshtein(word, self.words[i]) for i in ids],
+                            np.int64)
+
+        one = np.uint64(1)
+        peq = np.zeros(256, np.uint64)
+        for i, c in enumerate(bytearray(word)):
+            peq[c] |= np.uint64(1 << i)
+        high = np.uint64(1 << (m - 1))
+        codes = np.asfortranarray(self._codes[ids])
+        pv = np.zeros(len(ids), np.uint64) + np.uint64((1 << m) - 1)
+        mv = np.zeros(len(ids), np.uint64)
+        score = np.zeros(len(ids), np.int64) + m
+        result = score.copy()
+        for t in range(lengths.max() if len(ids) > 0 else 0):
+            eq = peq[codes[:, t]]
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            score += (ph & high) != 0
+            score -= (mh & high) != 0
+            # The first row of the dynamic programming matrix increases by
+            # one at each column (global rather than substring matching)
+            ph = (ph << one) | one
+            mh = mh << one
+            pv = mh | ~(xv | ph)
+            mv = ph & xv
+            done = lengths == t + 1
+            result[done] = score[done]
+        return result
+
+    def within(self, word, max_distance):
+        '''
+        The strings within max_distance of word, not counting word itself,
+        as (distances, ids) arrays
+        '''
+        return self._search(word, max_distance=max_distance)
+
+    def nearest(self, word, n=20):
+        '''
+        The n strings closest to word in Levenshtein distance, not counting
+        word itself, as (distances, ids) arrays sorted by distance; ties are
+        broken by order in the lexicon
+        '''
+        distances, ids = self._search(word, n=n)
+        order = np.lexsort((ids, distances))[:n]
+        return distances[order], ids[order]
+
+    def _search(self, word, max_distance=None, n=None):
+        m = len(word)
+        shared = self.shared_bigrams(word)
+        length_diff = np.abs(self.lengths - m)
+        longest = np.maximum(self.lengths, m)
+        # No two strings are farther apart than the longer one's length
+        max_k = max(m, self._codes.shape[1])
+        distances = np.zeros(len(self.words), np.int64) + max_k + 1
+        computed = np.zeros(len(self.words), bool)
+        self_id = self.word_ids.get(word)
+        if self_id is not None:
+            computed[self_id] = True
+
+        k = 1 if max_distance is None else max_distance
+        while True:
+            candidates = np.nonzero(~computed & (length_diff <= k) &
+                                    (shared >= longest + 1 - 2 * k))[0]
+            distances[candidates] = self.distances(word, candidates)
+            computed[candidates] = True
+            found = np.nonzero(distances <= k)[0]
+            if max_distance is not None or len(found) >= n or k >= max_k:
+                return distances[found], found
+            k += 1
+
+
+def _mismatches(a, b):
+    if len(a) != len(b):
+        return -1
+    return sum(x != y for x, y in zip(a, b))
+
+
+def levenshtein(a, b):
+    previous = range(len(b) + 1)
+    for i, x in enumerate(a):
+        current = [i + 1]
+        for j, y in enumerate(b):
+            current.append(min(previous[j + 1] + 1, current[j] + 1,
+                               previous[j] + (x != y)))
+        previous = current
+    return previous[-1]
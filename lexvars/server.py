@@ -0,0 +1,230 @@
+# License: BSD (3-clause)
+
+'''
+Keeps CELEX, LexVars, VALEX and ValexRelativeEntropy loaded in a long-lived
+process and answers queries over HTTP, so that scripts and notebooks don't
+have to parse the lexicons every time they start. Start the server once:
+
+python -m lexvars.server --celex ~/celex_english \\
+    --valex data/subcat/lex-lrec2.csv
+
+and then, from any number of processes on the same machine:
+
+>> lv = LexVarsClient()
+>> lv.inflectional_entropy('shoe')
+0.919
+>> lv.inflectional_entropies(['shoe', 'xyzzy'])
+array([ 0.919,    nan])
+>> lv.variables(['shoe', 'run'], ['old20', 'subcat_entropy'])
+{'old20': array([ 1.65,  1.1 ]), 'subcat_entropy': array([   nan,  3.41])}
+
+The client has the same methods as LexVars (see exposed), with the same
+arguments and return values; CELEX records are returned as dictionaries
+of their raw fields. It also has variables, which computes any of the
+variables of lexvars.table for a list of words, and subcat_entropies and
+subcat_relative_entropies, which return the values for a list of verbs.
+KeyError and ValueError raised by the server are raised again in the
+client.
+
+Each request is a POST of a JSON object {"method": ..., "args": [...],
+"kwargs": {...}}. Requests are answered one at a time, in the order they
+arrive, since the lexicons build some of their indexes the first time they
+are used.
+'''
+
+import argparse
+import BaseHTTPServer
+import json
+import sys
+import urllib2
+
+import numpy as np
+
+from celex import CelexRecord
+from table import LexVarsTable
+
+# LexVars methods that the server answers
+exposed = ['wordnet_synsets', 'wordnet_synset_counts', 'pos_freq',
+           'pos_freqs', 'log_noun_to_verb_ratio', 'log_noun_to_verb_ratios',
+           'derivational_family', 'derivational_entropy',
+           'derivational_family_sizes', 'derivational_entropies',
+           'coltheart_n', 'frequency_weighted_n', 'old20',
+           'phonological_density', 'pld20', 'inflectional_entropy',
+           'inflectional_entropies', 'entropy']
+
+default_port = 8767
+
+
+def _encode(value):
+    # JSON-serializable version of a return value; arrays are tagged so the
+    # client can turn them back into arrays (NaN is sent as null)
+    if isinstance(value, np.ndarray):
+        values = value.astype(float)
+        return {'array': [None if np.isnan(x) else x for x in values.tolist()]}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, CelexRecord):
+        return value._d
+    if isinstance(value, dict):
+        return dict((k, _encode(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return [_encode(x) for x in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and value.keys() == ['array']:
+        return np.array([np.nan if x is None else x for x in value['array']],
+                        float)
+    if isinstance(value, dict):
+        return dict((str(k), _decode(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_decode(x) for x in value]
+    if isinstance(value, unicode):
+        return str(value)
+    return value
+
+
+def _strings(value):
+    # JSON strings come back as unicode; the lexicons are byte strings
+    if isinstance(value, unicode):
+        return str(value)
+    if isinstance(value, list):
+        return [_strings(x) for x in value]
+    if isinstance(value, dict):
+        return dict((str(k), _strings(v)) for k, v in value.items())
+    return value
+
+
+class LexVarsServer(BaseHTTPServer.HTTPServer):
+    '''
+    HTTP server that answers queries with a LexVarsTable, which holds the
+    lexicons. preload loads the CELEX tables and VALEX before the server
+    starts answering; the neighbourhood and paradigm indexes are built by
+    the first query that needs them and are then kept.
+    '''
+
+    def __init__(self, table, host='127.0.0.1', port=default_port,
+                 preload=True):
+        self.table = table
+        if preload:
+            if table.celex_root is not None or table._clx is not None:
+                table.celex().load_lemmas()
+                table.celex().load_wordforms()
+            if table.valex_path is not None:
+                table.valex()
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), _Handler)
+
+    def call(self, method, args, kwargs):
+        if method == 'variables':
+            return self.table.compute(*args, **kwargs)
+        if method in ['subcat_entropies', 'subcat_relative_entropies']:
+            values = getattr(self.table, method)()
+            return dict((verb, values.get(verb)) for verb in args[0])
+        if method not in exposed:
+            raise ValueError('Unknown method %s' % method)
+        return getattr(self.table.lexvars(), method)(*args, **kwargs)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        try:
+            request = _strings(json.loads(self.rfile.read(length)))
+            result = self.server.call(request['method'],
+                                      request.get('args', []),
+                                      request.get('kwargs', {}))
+            response = {'result': _encode(result)}
+            status = 200
+        except (KeyError, ValueError, TypeError) as e:
+            response = {'error': e.__class__.__name__,
+                        'message': e.args[0] if e.args else ''}
+            status = 400
+        except Exception as e:
+            # E.g. LookupError from wordnet_synsets without the WordNet data;
+            # the client still gets a response it can report
+            response = {'error': e.__class__.__name__, 'message': str(e)}
+            status = 500
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LexVarsClient(object):
+    '''
+    Client for a LexVarsServer, with the methods of LexVars (see the module
+    docstring)
+    '''
+
+    errors = {'KeyError': KeyError, 'ValueError': ValueError,
+              'TypeError': TypeError}
+
+    def __init__(self, url='http://127.0.0.1:%d/' % default_port):
+        self.url = url
+
+    def call(self, method, *args, **kwargs):
+        body = json.dumps({'method': method, 'args': _encode(list(args)),
+                           'kwargs': _encode(kwargs)})
+        request = urllib2.Request(self.url, body,
+                                  {'Content-Type': 'application/json'})
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError as e:
+            if e.code not in [400, 500]:
+                raise
+            response = e
+        response = json.loads(response.read())
+        if 'error' in response:
+            message = _decode(response['message'])
+            if response['error'] in self.errors:
+                raise self.errors[response['error']](message)
+            raise RuntimeError('%s: %s' % (response['error'], message))
+        return _decode(response['result'])
+
+    def variables(self, words, names):
+        '''
+        Dictionary from each of the variable names (see lexvars.table) to an
+        array of its values for the words
+        '''
+        return self.call('variables', list(words), list(names))
+
+    def subcat_entropies(self, verbs):
+        return self.call('subcat_entropies', list(verbs))
+
+    def subcat_relative_entropies(self, verbs):
+        return self.call('subcat_relative_entropies', list(verbs))
+
+    def __getattr__(self, name):
+        if name not in exposed:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve lexical variables over HTTP')
+    parser.add_argument('--celex', help='CELEX english directory')
+    parser.add_argument('--valex', help='VALEX lexicon directory or CSV file')
+    parser.add_argument('--cds', help='contextual distinctiveness JSON file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=default_port)
+    args = parser.parse_args(argv)
+
+    table = LexVarsTable(args.celex, args.valex, args.cds)
+    server = LexVarsServer(table, args.host, args.port)
+    print >> sys.stderr, 'Serving on http://%s:%d/' % server.server_address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+# License: BSD (3-clause)
+
+import numpy as np
+
+import instrument
+
+
+class SimilarityIndex(object):
+    '''
+    Index over the subcategorization distributions of a SubcatMatrix (see
+    subcat.py) for finding the verbs with the most similar distributions.
+    The rows are normalized to sum to 1, and the distance between two
+    verbs is one of:
+
+    * 'js': the Jensen-Shannon divergence (base 2, between 0 and 1)
+    * 'hellinger': the Hellinger distance, sqrt(1 - sum(sqrt(p * q)))
+    * 'cosine': 1 - the cosine of the two distributions
+
+    Distances from many verbs at once are computed in blocks of query
+    verbs, so that each block is a few array operations over all of the
+    verbs; Hellinger and cosine are matrix products. The Jensen-Shannon
+    divergence needs a logarithm for every frame of every pair of verbs,
+    so nearest neighbours by JS are found with the bounds
+
+    h ** 2 <= JS <= h ** 2 / ln(2)
+
+    where h is the Hellinger distance (both are f-divergences, and the
+    ratio of their generating functions is between ln(2) and 1): JS is
+    only computed for the verbs whose lower bound is within the n-th
+    smallest upper bound. The result is exact.
+
+    >> index = vlx.similarity_index('js')
+    >> distances, ids = index.nearest('eat', 10)
+    >> print index.verbs[ids]
+    '''
+
+    metrics = ['js', 'hellinger', 'cosine']
+    # Approximate number of array elements computed at once
+    block_elements = 1 << 22
+
+    def __init__(self, matrix, metric='js'):
+        if metric not in self.metrics:
+            raise ValueError('Unknown metric "%s"' % metric)
+        self.metric = metric
+        self.verbs = matrix.verbs
+        self.verb_ids = dict((verb, i) for i, verb in
+                             enumerate(self.verbs.tolist()))
+        relfreq = matrix.relfreq.tocsr()
+        totals = np.asarray(relfreq.sum(axis=1)).ravel()
+        scale = 1 / np.where(totals == 0, 1, totals)
+        self._sparse = relfreq.multiply(scale[:, np.newaxis]).tocsr()
+        self._sparse.eliminate_zeros()
+        self._sparse.sort_indices()
+        p = self._sparse.toarray()
+        if metric == 'js':
+            self._p = p
+            self._entropies = -_p_log_p(p).sum(axis=1)
+            self._empty = totals == 0
+            self._vectors = np.sqrt(p)
+        elif metric == 'hellinger':
+            self._vectors = np.sqrt(p)
+        else:
+            norms = np.sqrt((p ** 2).sum(axis=1))
+            self._vectors = p / np.where(norms == 0, 1, norms)[:, np.newaxis]
+
+    def __len__(self):
+        return len(self.verbs)
+
+    def _block_size(self):
+        return max(int(self.block_elements / max(len(self.verbs), 1)), 1)
+
+    def distances(self, rows):
+        '''
+        Array of the distances from each of the verbs in rows (indices into
+        verbs) to all of the verbs, with a row for each of them
+        '''
+        rows = np.asarray(rows, np.int64)
+        if self.metric == 'js':
+            n = len(self.verbs)
+            return self._js(np.repeat(rows, n),
+                            np.tile(np.arange(n), len(rows))).reshape(
+                                len(rows), n)
+        similarity = self._vectors[rows].dot(self._vectors.T)
+        if self.metric == 'hellinger':
+            return np.sqrt(np.maximum(1 - similarity, 0))
+        return np.maximum(1 - similarity, 0)
+
+    def _js(self, a, b):
+        # Jensen-Shannon divergence of each pair of rows a[i], b[i]:
+        # the entropy of their average minus the average of their entropies
+        result = np.zeros(len(a))
+        step = max(int(self.block_elements / max(self._p.shape[1], 1)), 1)
+        for start in xrange(0, len(a), step):
+            i = a[start:start + step]
+            j = b[start:start + step]
+            m = (self._p[i] + self._p[j]) / 2
+            result[start:start + step] = -_p_log_p(m).sum(axis=1) - \
+                (self._entropies[i] + self._entropies[j]) / 2
+        return np.maximum(result, 0)
+
+    def nearest(self, verb, n=20):
+        '''
+        The n verbs closest to verb, not counting verb itself, as
+        (distances, ids) arrays sorted by distance; ties are broken by
+        order in verbs
+        '''
+        i = self.verb_ids[verb]
+        distances, ids = self._top(np.array([i]), n)
+        return distances[0], ids[0]
+
+    def top_k(self, n=20):
+        '''
+        The n nearest verbs of every verb (as in nearest), as two arrays
+        with a row for each verb: the distances and the ids of its
+        neighbours
+        '''
+        n = min(n, max(len(self.verbs) - 1, 0))
+        distances = np.zeros((len(self.verbs), n))
+        ids = np.zeros((len(self.verbs), n), np.int64)
+        step = self._block_size()
+        with instrument.phase('similarity.top_k') as phase:
+            for start in xrange(0, len(self.verbs), step):
+                rows = np.arange(start, min(start + step, len(self.verbs)))
+                distances[rows], ids[rows] = self._top(rows, n)
+            phase.add('verbs', len(self.verbs))
+        return distances, ids
+
+    def _top(self, rows, n):
+        # The n nearest verbs of each of the rows, excluding the row itself
+        n = min(n, max(len(self.verbs) - 1, 0))
+        if n == 0:
+            return np.zeros((len(rows), 0)), np.zeros((len(rows), 0), np.int64)
+        if self.metric == 'js':
+            d = self._js_candidates(rows, n)
+        else:
+            d = self.distances(rows)
+        d[np.arange(len(rows)), rows] = np.inf
+        # Keep the verbs closer than the n-th distance of each row, and of
+        # the verbs at that distance, the first ones in order
+        kth = np.partition(d, n - 1, axis=1)[:, n - 1:n]
+        closer = d < kth
+        tied = d == kth
+        needed = n - closer.sum(axis=1)[:, np.newaxis]
+        keep = closer | (tied & (np.cumsum(tied, axis=1) <= needed))
+        owners, ids = np.nonzero(keep)
+        values = d[owners, ids]
+        order = np.lexsort((ids, values, owners))
+        return (values[order].reshape(len(rows), n),
+                ids[order].reshape(len(rows), n))
+
+    def _js_candidates(self, rows, n):
+        # Distances from each of the rows to the verbs that may be among its
+        # n nearest by the Hellinger bounds (see the class docstring), and
+        # infinity to the others
+        h2 = np.maximum(1 - self._vectors[rows].dot(self._vectors.T), 0)
+        lower = h2.copy()
+        upper = h2 / np.log(2)
+        # The bounds only hold between distributions that sum to 1
+        lower[:, self._empty] = 0
+        upper[:, self._empty] = np.inf
+        lower[self._empty[rows]] = 0
+        upper[self._empty[rows]] = np.inf
+        upper[np.arange(len(rows)), rows] = np.inf
+        bound = np.partition(upper, n - 1, axis=1)[:, n - 1:n]
+        owners, ids = np.nonzero(lower <= bound * (1 + 1e-9) + 1e-12)
+        d = np.zeros((len(rows), len(self.verbs))) + np.inf
+        d[owners, ids] = self._js(rows[owners], ids)
+        return d
+
+
+def _p_log_p(p):
+    # p * log2(p), with 0 * log2(0) = 0
+    return np.where(p > 0, p * np.log2(np.where(p > 0, p, 1)), 0.)
@@ -0,0 +1,315 @@
+# License: BSD (3-clause)
+
+import os
+
+import numpy as np
+import scipy.sparse
+
+from entropy import entropies, group_offsets, kl_divergences
+
+
+class SubcatMatrix(object):
+    '''
+    The subcategorization distributions of all of the verbs of a lexicon as
+    one sparse (scipy.sparse CSR) matrix, with a row for each verb and a
+    column for each frame; verbs and frames are sorted arrays of the row
+    and column labels. If a verb lists the same frame more than once (as
+    the fine grained VALEX lexicons do, once per class), the entries are
+    summed.
+
+    >> m = vlx.subcat_matrix()
+    >> m.relfreq[m.verb_rows(['squash'])].toarray()
+    '''
+
+    def __init__(self, verbs, frames, relfreq, freqcnt):
+        self.verbs = verbs
+        self.frames = frames
+        self.relfreq = relfreq
+        self.freqcnt = freqcnt
+
+    @classmethod
+    def from_verbs(cls, verbs):
+        '''
+        Builds the matrix from a dictionary from each verb to its list of
+        frame dictionaries, like Valex.verbs
+        '''
+        names = sorted(verbs)
+        frames = [frame for verb in names for frame in verbs[verb]]
+        frame_names = np.array([frame['frame'] for frame in frames], str)
+        vocabulary, ids = np.unique(frame_names, return_inverse=True)
+        offsets = np.zeros(len(names) + 1, np.int64)
+        np.cumsum([len(verbs[verb]) for verb in names], out=offsets[1:])
+        return cls.from_columns(
+            names, offsets, vocabulary, ids,
+            [frame['relfreq'] for frame in frames],
+            [frame['freqcnt'] for frame in frames])
+
+    @classmethod
+    def from_columns(cls, verbs, offsets, frames, frame_ids, relfreq,
+                     freqcnt):
+        '''
+        Builds the matrix from the frames of all of the verbs as columns
+        (like those of FrozenVerbs): the frames of verbs[i] are
+        offsets[i]:offsets[i + 1], and frame_ids are indices into frames.
+        verbs and frames must be sorted.
+        '''
+        rows = np.repeat(np.arange(len(verbs)), np.diff(offsets))
+        shape = (len(verbs), len(frames))
+        matrices = []
+        for values in [relfreq, freqcnt]:
+            values = np.asarray(values, float)
+            matrix = scipy.sparse.csr_matrix((values, (rows, frame_ids)),
+                                             shape)
+            matrix.sum_duplicates()
+            matrices.append(matrix)
+        return cls(np.array(verbs, str), np.array(frames, str), *matrices)
+
+    def _positions(self, labels, keys):
+        # Index of each key in the sorted labels, or -1
+        keys = np.array(keys, str)
+        if len(labels) == 0:
+            return np.zeros(len(keys), np.int64) - 1
+        i = np.searchsorted(labels, keys)
+        i[i == len(labels)] = 0
+        i[labels[i] != keys] = -1
+        return i
+
+    def verb_rows(self, verbs):
+        '''
+        Row of each of the verbs (-1 for verbs that are not in the matrix)
+        '''
+        return self._positions(self.verbs, verbs)
+
+    def frame_columns(self, frames):
+        return self._positions(self.frames, frames)
+
+    def weighted_average(self, weights):
+        '''
+        Distribution over the frames averaged over the verbs, where verb i
+        has weight weights[i] (e.g. its frequency), normalized to sum to 1
+        '''
+        total = self.relfreq.T.dot(np.asarray(weights, float))
+        return total / total.sum()
+
+    def entropies(self):
+        '''
+        Entropy of the frame distribution (relfreq) of each verb
+        '''
+        return entropies(self.relfreq.data, self.relfreq.indptr,
+                         normalize=False)
+
+    def kl_divergences(self, reference, frames=None):
+        '''
+        Kullback-Leibler divergence of the reference distribution (an array
+        over the frames) from the frame distribution of each verb. If frames
+        (a boolean array over the frames) is given, only those frames are
+        included in the sums.
+        '''
+        matrix = self.relfreq
+        owners = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        keep = np.ones(len(matrix.indices), bool) if frames is None \
+            else frames[matrix.indices]
+        offsets = group_offsets(owners[keep], matrix.shape[0])
+        return kl_divergences(matrix.data[keep],
+                              reference[matrix.indices[keep]], offsets,
+                              normalize=False)
+
+
+class SubcatTensor(object):
+    '''
+    The subcategorization distributions of several lexicons (e.g. the
+    VALEX releases in data/subcat) aligned on one verb vocabulary and one
+    frame vocabulary, as a lexicon x verb x frame tensor. The tensor is
+    stored as a CSR matrix with a row for each (lexicon, verb) pair:
+    row l * len(verbs) + v holds the distribution of verb v in lexicon l,
+    and present[l, v] is True if lexicon l has verb v at all. The measures
+    below are computed for every verb in every lexicon at once; they are
+    NaN for verbs that are missing from a lexicon.
+
+    >> t = SubcatTensor.read_csvs('data/subcat')
+    >> anlt = [name for name in t.lexicons if name.endswith('_anlt')]
+    >> t.entropies()[t.lexicon_index('lex-lrec2_anlt'), t.verb_index('eat')]
+    >> t.stability(anlt)[t.verb_index('eat')]
+
+    As in SubcatMatrix, frames that a verb lists more than once in a
+    lexicon (once per class, in the files that aren't _anlt) are summed.
+    '''
+
+    def __init__(self, lexicons, verbs, frames, relfreq, freqcnt, present):
+        self.lexicons = lexicons
+        self.verbs = verbs
+        self.frames = frames
+        self.relfreq = relfreq
+        self.freqcnt = freqcnt
+        self.present = present
+
+    @classmethod
+    def from_matrices(cls, lexicons, matrices):
+        '''
+        Aligns a SubcatMatrix for each of the lexicons (a list of names)
+        '''
+        verbs = np.unique(np.concatenate(
+            [np.array([], str)] + [m.verbs for m in matrices]))
+        frames = np.unique(np.concatenate(
+            [np.array([], str)] + [m.frames for m in matrices]))
+        present = np.zeros((len(lexicons), len(verbs)), bool)
+        rows = []
+        cols = []
+        values = {'relfreq': [], 'freqcnt': []}
+        for l, m in enumerate(matrices):
+            verb_rows = np.searchsorted(verbs, m.verbs)
+            present[l, verb_rows] = True
+            frame_cols = np.searchsorted(frames, m.frames)
+            owners = np.repeat(np.arange(len(m.verbs)),
+                               np.diff(m.relfreq.indptr))
+            rows.append(l * len(verbs) + verb_rows[owners])
+            cols.append(frame_cols[m.relfreq.indices])
+            for field in values:
+                values[field].append(getattr(m, field).data)
+        rows = np.concatenate([np.array([], np.int64)] + rows)
+        cols = np.concatenate([np.array([], np.int64)] + cols)
+        shape = (len(lexicons) * len(verbs), len(frames))
+        matrices = []
+        for field in ['relfreq', 'freqcnt']:
+            data = np.concatenate([np.array([])] + values[field])
+            matrices.append(scipy.sparse.csr_matrix((data, (rows, cols)),
+                                                    shape))
+        return cls(list(lexicons), verbs, frames, matrices[0], matrices[1],
+                   present)
+
+    @classmethod
+    def read_csvs(cls, filenames, cache_dir=None, use_cache=True):
+        '''
+        Reads CSVs written by Valex.write_csv (a list of filenames, or a
+        directory, in which case all of its .csv files are read) with
+        Valex.read_csv; each lexicon is named after its file, without the
+        .csv extension
+        '''
+        from valex import Valex
+        if isinstance(filenames, basestring):
+            filenames = [os.path.join(filenames, name)
+                         for name in sorted(os.listdir(filenames))
+                         if name.endswith('.csv')]
+        matrices = []
+        for filename in filenames:
+            vlx = Valex(os.path.dirname(filename), cache_dir=cache_dir,
+                        use_cache=use_cache)
+            vlx.read_csv(filename)
+            matrices.append(vlx.subcat_matrix())
+        lexicons = [os.path.splitext(os.path.basename(filename))[0]
+                    for filename in filenames]
+        return cls.from_matrices(lexicons, matrices)
+
+    def lexicon_index(self, name):
+        return self.lexicons.index(name)
+
+    def verb_index(self, verb):
+        i = np.searchsorted(self.verbs, verb)
+        if i == len(self.verbs) or self.verbs[i] != verb:
+            raise KeyError(verb)
+        return i
+
+    def _selection(self, lexicons):
+        # Indices of the named lexicons (all of them if None)
+        if lexicons is None:
+            return np.arange(len(self.lexicons))
+        return np.array([self.lexicon_index(name) for name in lexicons],
+                        np.int64)
+
+    def lexicon(self, name):
+        '''
+        The distributions of one lexicon as a SubcatMatrix over the verbs
+        it has, with the frame columns of the shared vocabulary
+        '''
+        l = self.lexicon_index(name)
+        rows = l * len(self.verbs) + np.flatnonzero(self.present[l])
+        return SubcatMatrix(self.verbs[self.present[l]], self.frames,
+                            self.relfreq[rows], self.freqcnt[rows])
+
+    def distributions(self, verb):
+        '''
+        Dense lexicon x frame array of the distributions of a verb
+        '''
+        v = self.verb_index(verb)
+        rows = np.arange(len(self.lexicons)) * len(self.verbs) + v
+        return self.relfreq[rows].toarray()
+
+    def _by_lexicon(self, values):
+        # Per-row values as a lexicon x verb array, NaN for missing verbs
+        values = np.asarray(values, float).reshape(self.present.shape)
+        return np.where(self.present, values, np.nan)
+
+    def entropies(self):
+        '''
+        Lexicon x verb array of the entropy of each distribution
+        '''
+        return self._by_lexicon(entropies(self.relfreq.data,
+                                          self.relfreq.indptr,
+                                          normalize=False))
+
+    def reference_distributions(self, weights=None):
+        '''
+        Lexicon x frame array of the average distribution of each lexicon,
+        where verb v has weight weights[v] (e.g. its CELEX frequency; an
+        array over the verbs, or a lexicon x verb array), normalized to sum
+        to 1. By default all of the verbs of a lexicon have the same weight.
+        '''
+        n_lexicons, n_verbs = self.present.shape
+        if weights is None:
+            weights = self.present
+        weights = np.broadcast_to(np.asarray(weights, float),
+                                  self.present.shape) * self.present
+        averaging = scipy.sparse.csr_matrix(
+            (weights.ravel(), (np.repeat(np.arange(n_lexicons), n_verbs),
+                               np.arange(n_lexicons * n_verbs))),
+            (n_lexicons, n_lexicons * n_verbs))
+        total = averaging.dot(self.relfreq).toarray()
+        sums = total.sum(axis=1)[:, np.newaxis]
+        return total / np.where(sums == 0, 1, sums)
+
+    def kl_divergences(self, reference=None, weights=None):
+        '''
+        Lexicon x verb array of the Kullback-Leibler divergence of the
+        reference distribution of its lexicon from each distribution (the
+        relative entropy of ValexRelativeEntropy). reference is a lexicon
+        x frame array, or one distribution over the frames for all of the
+        lexicons; by default reference_distributions(weights).
+        '''
+        if reference is None:
+            reference = self.reference_distributions(weights)
+        reference = np.broadcast_to(
+            np.asarray(reference, float),
+            (len(self.lexicons), len(self.frames)))
+        matrix = self.relfreq
+        owners = np.repeat(np.arange(matrix.shape[0]),
+                           np.diff(matrix.indptr))
+        q = reference[owners // len(self.verbs), matrix.indices]
+        return self._by_lexicon(kl_divergences(matrix.data, q, matrix.indptr,
+                                               normalize=False))
+
+    def stability(self, lexicons=None):
+        '''
+        Array over the verbs of the Jensen-Shannon divergence between the
+        distributions of each verb in the given lexicons (all of them by
+        default), i.e. the entropy of their average minus the average of
+        their entropies: 0 if the verb has the same distribution in all of
+        them. Only the lexicons that have the verb are included; the
+        divergence is NaN for verbs that are in fewer than two of them.
+        '''
+        selected = self._selection(lexicons)
+        n_lexicons, n_verbs = self.present.shape
+        present = self.present[selected]
+        counts = present.sum(axis=0)
+        weights = present / np.maximum(counts, 1).astype(float)
+        rows = (selected[:, np.newaxis] * n_verbs +
+                np.arange(n_verbs)).ravel()
+        averaging = scipy.sparse.csr_matrix(
+            (weights.ravel(), (np.tile(np.arange(n_verbs), len(selected)),
+                               rows)),
+            (n_verbs, n_lexicons * n_verbs))
+        average = averaging.dot(self.relfreq)
+        average.sum_duplicates()
+        mean_entropy = np.nansum(self.entropies()[selected] * weights, axis=0)
+        js = entropies(average.data, average.indptr, normalize=False) - \
+            mean_entropy
+        return np.where(counts >= 2, js, np.nan)
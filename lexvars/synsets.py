@@ -0,0 +1,121 @@
+# License: BSD (3-clause)
+
+import os
+
+import numpy as np
+
+from buffers import StringTable, read_pack, write_pack
+
+
+def wordnet_version():
+    '''
+    Version of the WordNet data that NLTK reads (requires NLTK)
+    '''
+    from nltk.corpus import wordnet
+    return wordnet.get_version()
+
+
+class SynsetTable(object):
+    '''
+    Number of WordNet synsets of each word, in total and for each part of
+    speech, precomputed with NLTK (see build_arrays) and saved in the
+    lexvars buffer format. Loading and querying the table doesn't import
+    NLTK. LexVars.synset_table keeps the table in the Celex cache
+    directory; it can also be saved to a file of its own:
+
+    >> SynsetTable.build(filename, words=extra_words)    # once
+    >> table = SynsetTable.read(filename)
+    >> table.count('bank')
+    18
+    >> table.count('bank', 'verb')
+    8
+    >> table.counts(['bank', 'xyzzy'])
+    array([ 18.,  nan])
+
+    The counts are those of nltk.corpus.wordnet.synsets(word), which also
+    finds the synsets of inflected forms (e.g. "banks"). The table includes
+    all of the WordNet lemma names and the words given to build_arrays; any
+    other word is treated as having no synsets.
+    '''
+
+    pos_names = ['noun', 'verb', 'adjective', 'adverb']
+
+    def __init__(self, arrays, meta):
+        '''
+        arrays, meta: as returned by build_arrays
+        '''
+        self.meta = meta
+        self.words = StringTable(arrays['words.data'], arrays['words.offsets'])
+        # Columns are the parts of speech in pos_names, then the total
+        self.table = arrays['counts']
+        self._rows = dict((w, i) for i, w in enumerate(self.words))
+
+    @classmethod
+    def read(cls, filename):
+        return cls(*read_pack(filename))
+
+    @staticmethod
+    def build_arrays(words=()):
+        '''
+        Counts the synsets of every WordNet lemma name and of the given
+        words (e.g. all of the CELEX wordforms). Returns (arrays, meta) for
+        write_pack; requires NLTK and its WordNet data.
+        '''
+        from nltk.corpus import wordnet
+        pos_tags = [wordnet.NOUN, wordnet.VERB, wordnet.ADJ, wordnet.ADV]
+        # wordnet.synsets lowercases its argument
+        words = set(w.lower() for w in words)
+        words.update(wordnet.all_lemma_names())
+        found = []
+        rows = []
+        for word in sorted(words):
+            counts = [len(wordnet.synsets(word, pos)) for pos in pos_tags]
+            if sum(counts) > 0:
+                found.append(word)
+                rows.append(counts + [sum(counts)])
+        data, offsets = StringTable.build(found)
+        arrays = {'words.data': data, 'words.offsets': offsets,
+                  'counts': np.array(rows, np.int32).reshape(-1, 5)}
+        return arrays, {'wordnet_version': wordnet.get_version()}
+
+    @classmethod
+    def build(cls, filename, words=()):
+        '''
+        Builds the table (see build_arrays) and writes it to filename
+        '''
+        arrays, meta = cls.build_arrays(words)
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        write_pack(filename, arrays, meta)
+        return cls.read(filename)
+
+    def _column(self, pos):
+        if pos is None:
+            return len(self.pos_names)
+        if pos not in self.pos_names:
+            raise ValueError('Unknown part of speech "%s"' % pos)
+        return self.pos_names.index(pos)
+
+    def count(self, word, pos=None):
+        '''
+        Number of synsets of the word, optionally only those of the given
+        part of speech (one of pos_names); None if there are none
+        '''
+        column = self._column(pos)
+        row = self._rows.get(word.lower())
+        if row is None or self.table[row, column] == 0:
+            return None
+        return int(self.table[row, column])
+
+    def counts(self, words, pos=None):
+        '''
+        Array of count for each of the words, with NaN instead of None
+        '''
+        column = self._column(pos)
+        rows = np.array([self._rows.get(w.lower(), -1) for w in words],
+                        np.int64)
+        result = np.zeros(len(rows)) + np.nan
+        result[rows >= 0] = self.table[rows[rows >= 0], column]
+        result[result == 0] = np.nan
+        return result
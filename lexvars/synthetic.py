@@ -0,0 +1,313 @@
+# License: BSD (3-clause)
+
+'''
+Synthetic CELEX, VALEX and BNC files, for testing and benchmarking without
+the licensed corpora. The files have the same layout as the real ones (the
+.cd databases of CELEX's english directory, one .lex or .lex.bz2 file of
+#S(EPATTERN ...) records per verb, and a three-level directory tree of
+BNC texts with <w TAG>word tokens), and roughly their statistics:
+Zipf-distributed frequencies, derived and compound lemmas that share
+morphemes, inflected wordforms for each part of speech, and a skewed
+distribution over the VALEX frames. The content is random; only the
+structure is realistic.
+
+python -m lexvars.synthetic /tmp/fixtures --lemmas 50000 --verbs 3000
+
+writes /tmp/fixtures/celex (a Celex root), /tmp/fixtures/valex (a Valex
+path) and /tmp/fixtures/bnc (a BNCWordVecs corpus root).
+'''
+
+import argparse
+import bisect
+import bz2
+import math
+import os
+import random
+
+from celex import Celex, db_fields
+
+letters = 'aabcdeeefghiiklmnoopqrsttuvwy'
+disc_phonemes = 'pbtdkgNmnlrfvTDszSZjxhwJ_CFHPR@Iiu{E13456789cq#$'
+suffixes = [('er', 1), ('ness', 1), ('ment', 1), ('able', 2), ('ly', 7),
+            ('ize', 4), ('ful', 2)]
+
+# The VALEX frames, with their approximate number of verbs in lex-lrec2
+valex_frames = [
+    ('PP', 7141), ('NP_PP', 7061), ('NP', 5913), ('NONE', 5687),
+    ('PP_PP', 3259), ('SCOMP', 1327), ('NP PRT +', 873), ('NP_SCOMP', 853),
+    ('VPINF', 348), ('PP_SCOMP', 339), ('SINF', 328), ('NP_NP', 309),
+    ('NP_NP_SCOMP', 285), ('WHPP', 216), ('VPPRT', 209),
+    ('NP_PP PRT +', 196), ('VPBSE', 190), ('SING_PP', 174),
+    ('NP_WHPP', 164), ('AP', 160), ('PP_WHPP', 154), ('PP_WHVP', 125),
+    ('PP_VPINF', 117), ('NP_AP PRT +', 116), ('SING', 114), ('PP_AP', 90),
+    ('NP_AP', 89), ('NP_NP PRT +', 48), ('NP_PP_PP', 47),
+    ('NP_SCOMP PRT +', 44), ('PP_WHS', 37), ('SINF PRT +', 26),
+    ('VPING_PP', 20), ('NP_PPOF', 14), ('VPING', 5)]
+
+bnc_tags = [('NN1', 30), ('NN2', 10), ('VVB', 6), ('VVD', 6), ('VVZ', 3),
+            ('VVG', 3), ('VVN', 4), ('AJ0', 12), ('AV0', 8), ('AT0', 8),
+            ('PRP', 8), ('PNP', 6), ('CJC', 4)]
+
+function_words = ['the', 'of', 'and', 'a', 'in', 'to', 'it', 'is', 'was',
+                  'that', 'for', 'on', 'with', 'as', 'he', 'she', 'they']
+
+
+def _zipf(rng, n, exponent=1.):
+    # Frequencies of n items in random order, the i-th most frequent one
+    # proportional to 1 / i ** exponent
+    freqs = [int(1e6 / (i + 1) ** exponent) for i in range(n)]
+    rng.shuffle(freqs)
+    return freqs
+
+
+def _weighted(rng, choices):
+    total = sum(w for x, w in choices)
+    r = rng.uniform(0, total)
+    for x, w in choices:
+        r -= w
+        if r <= 0:
+            return x
+    return choices[-1][0]
+
+
+def _root(rng):
+    return ''.join(rng.choice(letters) for i in range(rng.randint(3, 8)))
+
+
+def _pronunciation(rng, word):
+    phonemes = [rng.choice(disc_phonemes)
+                for i in range(max(1, len(word) - 1))]
+    n = len(phonemes)
+    syllables = [''.join(phonemes[i:i + 3]) for i in range(0, n, 3)]
+    return ['P', "'" + '-'.join(syllables), '[CVC]' * len(syllables),
+            '[abc]' * len(syllables)]
+
+
+def _frequency_fields(cob, total):
+    # Cob, CobDev, CobMln, CobLog, CobW, CobWMln, CobWLog, CobS, CobSMln,
+    # CobSLog, as in the efl and efw databases
+    mln = cob * 1e6 / total
+    spoken = cob // 14
+    written = cob - spoken
+    log = lambda x: '%.2f' % math.log10(x + 1)
+    return [str(cob), '0', str(int(mln)), log(mln), str(written),
+            str(int(written * 1e6 / total)), log(written * 1e6 / total),
+            str(spoken), str(int(spoken * 1e6 / total)),
+            log(spoken * 1e6 / total)]
+
+
+def _inflections(rng, head, class_num):
+    # (FlectType, wordform) pairs; class_num is 1 (noun), 2 (adjective),
+    # 4 (verb) or 7 (adverb)
+    if class_num == 1:
+        return [('S', head), ('P', head + 's')]
+    if class_num == 2:
+        return [('b', head), ('c', head + 'er'), ('s', head + 'est')]
+    if class_num == 4:
+        past = head + 'ed' if rng.random() < 0.9 else _root(rng)
+        return [('i', head), ('e1S', head), ('e3S', head + 's'),
+                ('pe', head + 'ing'), ('pa', past), ('a1S', past)]
+    return [('X', head)]
+
+
+def _parse(rng, imm, morphemes):
+    parse = dict((f, 'N') for f in Celex.eml_parse)
+    parse.update({'Der': 'Y' if len(morphemes) > 1 else 'N', 'Imm': imm,
+                  'ImmSubCat': rng.choice('NA12'),
+                  'ImmSA': 'S' * len(morphemes), 'TransDer': '',
+                  'FlatSA': 'S' * len(morphemes),
+                  'StrucLab': '(%s)[N]' % ')('.join(morphemes),
+                  'StrucAllo': 'N' * len(morphemes)})
+    return [parse[f] for f in Celex.eml_parse]
+
+
+def write_celex(root, n_lemmas=10000, seed=0):
+    '''
+    Writes the seven CELEX English databases (esl, efl, eml, epl, emw, efw
+    and epw) with n_lemmas lemmas into root/<db>/<db>.cd. About half of the
+    lemmas are monomorphemic; the others are derived from them with a
+    suffix, or compounds of two of them, so they form derivational
+    families. Some headwords are shared by lemmas of different parts of
+    speech, as in CELEX.
+    '''
+    rng = random.Random(seed)
+    n_roots = max(1, n_lemmas // 2)
+    roots = [_root(rng) for i in range(n_roots)]
+    lemmas = []
+    for i in range(n_lemmas):
+        if i < n_roots:
+            head = roots[i]
+            morphemes = [head]
+            class_num = _weighted(rng, [(1, 5), (4, 3), (2, 2)])
+            if i > 0 and rng.random() < 0.05:
+                # The same headword as another part of speech
+                head, morphemes = lemmas[i - 1][0], lemmas[i - 1][1]
+                class_num = 4 if lemmas[i - 1][2] != 4 else 1
+        elif rng.random() < 0.7:
+            base = rng.choice(roots)
+            suffix, class_num = rng.choice(suffixes)
+            head = base + suffix
+            morphemes = [base, suffix]
+        else:
+            morphemes = [rng.choice(roots), rng.choice(roots)]
+            head = ''.join(morphemes)
+            class_num = 1
+        lemmas.append((head, morphemes, class_num))
+
+    cobs = _zipf(rng, n_lemmas)
+    total = sum(cobs) * 2
+    lines = dict((db, []) for db in ['esl', 'efl', 'eml', 'epl', 'emw', 'efw',
+                                     'epw'])
+    n_features = len(db_fields['esl']) - 4
+    wordform_id = 0
+    for i, (head, morphemes, class_num) in enumerate(lemmas):
+        id_num = str(i + 1)
+        cob = cobs[i]
+        lines['esl'].append([id_num, head, str(cob), str(class_num)] +
+                            [rng.choice('YN') for j in range(n_features)])
+        lines['efl'].append([id_num, head] + _frequency_fields(cob, total))
+        status = 'M' if len(morphemes) == 1 else 'C'
+        lines['eml'].append([id_num, head, str(cob), status, '', '1'] +
+                            _parse(rng, '+'.join(morphemes), morphemes))
+        prons = [_pronunciation(rng, head)
+                 for j in range(1 if rng.random() < 0.9 else 2)]
+        lines['epl'].append([id_num, head, str(cob), str(len(prons))] +
+                            sum(prons, []))
+        for flect_type, word in _inflections(rng, head, class_num):
+            wordform_id += 1
+            wf_cob = rng.randint(0, cob)
+            wf_id = str(wordform_id)
+            lines['emw'].append([wf_id, word, str(wf_cob), id_num, flect_type,
+                                 '@'])
+            lines['efw'].append([wf_id, word, id_num] +
+                                _frequency_fields(wf_cob, total))
+            lines['epw'].append([wf_id, word, str(wf_cob), id_num, '1'] +
+                                _pronunciation(rng, word))
+
+    for db, db_lines in lines.items():
+        dirname = os.path.join(root, db)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        f = open(os.path.join(dirname, db + '.cd'), 'w')
+        for line in db_lines:
+            f.write('\\'.join(line) + '\n')
+        f.close()
+
+
+def _valex_record(rng, verb, frame, class_num, class_freq, relfreq, freqcnt):
+    tags = ' '.join('(|%s| %s)' % (rng.choice(function_words),
+                                   _weighted(rng, bnc_tags))
+                    for i in range(rng.randint(2, 6)))
+    return ('#S(EPATTERN :TARGET |%s| :SUBCAT (VSUBCAT %s)\n'
+            ' :CLASSES (%d %d) :RELFREQ %s :FREQCNT %d\n'
+            ' :TLTL (%s)\n :SLTL ((%s) (%s))\n :OLT NIL :LTL (%s)\n'
+            ' :FREQSCORE %.4f)\n' %
+            (verb, frame, class_num, class_freq, relfreq, freqcnt, tags,
+             tags, tags, tags, rng.random()))
+
+
+def write_valex(path, n_verbs=2000, max_frames=40, compress=True, seed=0):
+    '''
+    Writes one VALEX lexicon file per verb into path (as verb.lex.bz2 if
+    compress, otherwise verb.lex). Each verb has between 1 and max_frames
+    frames; a frame can appear with several class numbers, as in the fine
+    grained VALEX lexicons.
+    '''
+    rng = random.Random(seed)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    # Each frame has a few class numbers
+    classes = {}
+    for i, (frame, weight) in enumerate(valex_frames):
+        classes[frame] = [i * 5 + j + 1 for j in range(rng.randint(1, 4))]
+    verbs = set()
+    while len(verbs) < n_verbs:
+        verbs.add(_root(rng))
+    for verb in sorted(verbs):
+        n_frames = min(max_frames, int(rng.paretovariate(1.2)) + 1)
+        counts = {}
+        for i in range(n_frames):
+            frame = _weighted(rng, valex_frames)
+            key = (frame, rng.choice(classes[frame]))
+            counts[key] = counts.get(key, 0) + rng.randint(1, 500)
+        total = float(sum(counts.values()))
+        records = [_valex_record(rng, verb, frame, class_num, rng.randint(
+                   count, count * 10), '%g' % round(count / total, 6), count)
+                   for (frame, class_num), count in sorted(counts.items())]
+        contents = ''.join(records)
+        if compress:
+            f = bz2.BZ2File(os.path.join(path, verb + '.lex.bz2'), 'w')
+        else:
+            f = open(os.path.join(path, verb + '.lex'), 'w')
+        f.write(contents)
+        f.close()
+
+
+def write_bnc(root, n_files=100, words_per_file=20000, vocabulary=20000,
+              seed=0):
+    '''
+    Writes n_files BNC texts into root/<A-K>/<A-K><0-9>/<name>, with one
+    <w TAG>word token per word, Zipf-distributed over a vocabulary of the
+    given size plus function words, in sentences of 5 to 30 words
+    '''
+    rng = random.Random(seed)
+    words = list(set(_root(rng) for i in range(vocabulary)))
+    freqs = _zipf(rng, len(words), 1.1)
+    cumulative = []
+    total = 0
+    for freq in freqs:
+        total += freq
+        cumulative.append(total)
+    for i in range(n_files):
+        first = 'ABCDEFGHJK'[i // 100 % 10]
+        dirname = os.path.join(root, first, '%s%d' % (first, i // 10 % 10))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        name = '%s%d%s' % (first, i // 10 % 10, 'ABCDEFGHJK'[i % 10])
+        parts = ['<bncDoc id=%s><text>\n' % name]
+        n = 0
+        sentence = 1
+        while n < words_per_file:
+            parts.append('<s n=%d>' % sentence)
+            for j in range(rng.randint(5, 30)):
+                if rng.random() < 0.4:
+                    word = rng.choice(function_words)
+                    tag = 'AT0' if word in ['the', 'a'] else 'PRP'
+                else:
+                    word = words[bisect.bisect(cumulative,
+                                               rng.uniform(0, total - 1))]
+                    tag = _weighted(rng, bnc_tags)
+                    if rng.random() < 0.05:
+                        word = word.capitalize()
+                parts.append('<w %s>%s ' % (tag, word))
+            parts.append('<c PUN>.\n')
+            n += j + 1
+            sentence += 1
+        parts.append('</text></bncDoc>\n')
+        f = open(os.path.join(dirname, name), 'w')
+        f.write(''.join(parts))
+        f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write synthetic CELEX, VALEX and BNC files')
+    parser.add_argument('output', help='directory for celex, valex and bnc')
+    parser.add_argument('--lemmas', type=int, default=10000)
+    parser.add_argument('--verbs', type=int, default=2000)
+    parser.add_argument('--bnc-files', type=int, default=20)
+    parser.add_argument('--bnc-words', type=int, default=20000,
+                        help='words per BNC file')
+    parser.add_argument('--uncompressed', action='store_true',
+                        help='write .lex rather than .lex.bz2 files')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    write_celex(os.path.join(args.output, 'celex'), args.lemmas, args.seed)
+    write_valex(os.path.join(args.output, 'valex'), args.verbs,
+                compress=not args.uncompressed, seed=args.seed)
+    write_bnc(os.path.join(args.output, 'bnc'), args.bnc_files,
+              args.bnc_words, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+# License: BSD (3-clause)
+
+'''
+Computes a table of lexical variables for a list of words, from the command
+line:
+
+python -m lexvars.table words.txt -v inflectional_entropy,old20 \\
+    --celex ~/celex_english -o table.csv -j 8
+
+or from Python:
+
+>> table = LexVarsTable(celex_root=path_to_celex)
+>> table.write_csv(words, ['inflectional_entropy', 'old20'], 'table.csv',
+                   processes=8)
+
+The lexicons are loaded once, in the parent process, before the worker pool
+is started, so the workers are forked with the lexicons already in memory
+(the CELEX tables and VALEX frames are first frozen into shared memory, see
+Celex.freeze and Valex.freeze, so those pages are shared outright). Words
+are sent to the workers in chunks, and each chunk is written to the CSV
+file as soon as it and all of the chunks before it are done. Words that a
+variable is not defined for get an empty cell.
+'''
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from celex import Celex
+from lexvars import LexVars
+from valex import Valex, ValexRelativeEntropy
+
+
+def _per_word(method, *args):
+    # A variable computed by calling a LexVars method on each word, with NaN
+    # for words it is not defined for
+    def compute(table, words):
+        lv = table.lexvars()
+        values = []
+        for word in words:
+            try:
+                value = getattr(lv, method)(word, *args)
+            except KeyError:
+                value = None
+            values.append(np.nan if value is None else value)
+        return np.array(values, float)
+    return compute
+
+
+def _from_dict(name):
+    def compute(table, words):
+        d = getattr(table, name)()
+        return np.array([np.nan if d.get(w) is None else d[w] for w in words],
+                        float)
+    return compute
+
+
+variables = {
+    'inflectional_entropy':
+        lambda t, w: t.lexvars().inflectional_entropies(w),
+    'inflectional_entropy_collapsed_bare':
+        lambda t, w: t.lexvars().inflectional_entropies(w, 'collapsed_bare'),
+    'inflectional_entropy_no_bare':
+        lambda t, w: t.lexvars().inflectional_entropies(w, 'no_bare'),
+    'derivational_entropy':
+        lambda t, w: t.lexvars().derivational_entropies(w),
+    'derivational_family_size':
+        lambda t, w: t.lexvars().derivational_family_sizes(w),
+    'noun_freq': lambda t, w: t.lexvars().pos_freqs(w, 'noun'),
+    'verb_freq': lambda t, w: t.lexvars().pos_freqs(w, 'verb'),
+    'adjective_freq': lambda t, w: t.lexvars().pos_freqs(w, 'adjective'),
+    'adverb_freq': lambda t, w: t.lexvars().pos_freqs(w, 'adverb'),
+    'log_noun_to_verb_ratio':
+        lambda t, w: t.lexvars().log_noun_to_verb_ratios(w),
+    'coltheart_n': _per_word('coltheart_n'),
+    'frequency_weighted_n': _per_word('frequency_weighted_n'),
+    'old20': _per_word('old20'),
+    'phonological_density': _per_word('phonological_density'),
+    'pld20': _per_word('pld20'),
+    'wordnet_synsets': lambda t, w: t.lexvars().wordnet_synset_counts(w),
+    'subcat_entropy': _from_dict('subcat_entropies'),
+    'subcat_relative_entropy': _from_dict('subcat_relative_entropies'),
+    'contextual_distinctiveness': _from_dict('contextual_distinctiveness')
+}
+
+
+def _prepare_inflection(table):
+    table.celex().load_lemmas()
+    table.lexvars().inflection_matrix()
+
+
+def _prepare_derivation(table):
+    table.celex().lemma_array('Cob')
+    table.lexvars().derivational_matrix()
+
+
+def _prepare_pos(table):
+    table.celex().lemma_array('ClassNum')
+    table.celex().lemma_array('Cob')
+
+
+def _prepare_orthographic(table):
+    table.lexvars().orthographic_index()
+
+
+def _prepare_phonological(table):
+    # The index loads the wordforms with their pronunciations, which are
+    # also used to look up the transcription of each word
+    table.lexvars().phonological_index()
+
+
+# Loads the lexicons, tables and indexes that each variable uses, whatever
+# the words (see LexVarsTable.prepare)
+preparers = {
+    'inflectional_entropy': _prepare_inflection,
+    'inflectional_entropy_collapsed_bare': _prepare_inflection,
+    'inflectional_entropy_no_bare': _prepare_inflection,
+    'derivational_entropy': _prepare_derivation,
+    'derivational_family_size': _prepare_derivation,
+    'noun_freq': _prepare_pos,
+    'verb_freq': _prepare_pos,
+    'adjective_freq': _prepare_pos,
+    'adverb_freq': _prepare_pos,
+    'log_noun_to_verb_ratio': _prepare_pos,
+    'coltheart_n': _prepare_orthographic,
+    'frequency_weighted_n': _prepare_orthographic,
+    'old20': _prepare_orthographic,
+    'phonological_density': _prepare_phonological,
+    'pld20': _prepare_phonological,
+    'wordnet_synsets': lambda t: t.lexvars().synset_table(),
+    'subcat_entropy': lambda t: t.subcat_entropies(),
+    'subcat_relative_entropy': lambda t: t.subcat_relative_entropies(),
+    'contextual_distinctiveness': lambda t: t.contextual_distinctiveness()
+}
+
+
+class LexVarsTable(object):
+    '''
+    Computes the variables in the variables dictionary for lists of words.
+    Each lexicon is loaded the first time a variable needs it.
+
+    celex_root: see Celex; needed for all variables except the ones below
+
+    valex_path: a directory of VALEX .lex files, or a CSV file written by
+        Valex.write_csv (such as the ones in data/subcat); needed for
+        subcat_entropy and subcat_relative_entropy (which also needs CELEX)
+
+    cds_file: contextual distinctiveness values saved by
+        BNCWordVecs.save_cds; needed for contextual_distinctiveness
+
+    clx: a Celex object to use instead of creating one from celex_root
+    '''
+
+    def __init__(self, celex_root=None, valex_path=None, cds_file=None,
+                 clx=None):
+        self.celex_root = celex_root
+        self.valex_path = valex_path
+        self.cds_file = cds_file
+        self._clx = clx
+        self._lv = None
+        self._vlx = None
+        self._subcat_entropies = None
+        self._subcat_relative_entropies = None
+        self._cds = None
+
+    def celex(self):
+        if self._clx is None:
+            if self.celex_root is None:
+                raise ValueError('This variable requires CELEX')
+            self._clx = Celex(self.celex_root)
+        return self._clx
+
+    def lexvars(self):
+        if self._lv is None:
+            self._lv = LexVars(self.celex())
+        return self._lv
+
+    def valex(self):
+        if self._vlx is None:
+            if self.valex_path is None:
+                raise ValueError('This variable requires VALEX')
+            if os.path.isdir(self.valex_path):
+                self._vlx = Valex(self.valex_path)
+                self._vlx.load_all_verbs(progress=False)
+            else:
+                self._vlx = Valex(os.path.dirname(self.valex_path))
+                self._vlx.read_csv(self.valex_path)
+        return self._vlx
+
+    def subcat_entropies(self):
+        if self._subcat_entropies is None:
+            self._subcat_entropies = self.valex().entropies()
+        return self._subcat_entropies
+
+    def subcat_relative_entropies(self):
+        if self._subcat_relative_entropies is None:
+            vre = ValexRelativeEntropy(self.celex(), self.valex())
+            vre.build_reference_distribution()
+            vre.calculate_relative_entropies()
+            self._subcat_relative_entropies = vre.relative_entropies
+        return self._subcat_relative_entropies
+
+    def contextual_distinctiveness(self):
+        if self._cds is None:
+            if self.cds_file is None:
+                raise ValueError('This variable requires a CD file')
+            self._cds = json.load(open(self.cds_file))
+        return self._cds
+
+    def freeze(self):
+        '''
+        Freezes the lexicons that have been loaded (see Celex.freeze and
+        Valex.freeze)
+        '''
+        if self._clx is not None:
+            self._clx.freeze()
+        if self._vlx is not None:
+            self._vlx.freeze()
+
+    def prepare(self, names):
+        '''
+        Loads everything that the variables use (lexicons, tables and
+        indexes), so that computing them afterwards loads nothing more
+        '''
+        _check_names(names)
+        for name in names:
+            preparers[name](self)
+
+    def compute(self, words, names):
+        '''
+        Dictionary from each of the variable names to an array of the
+        values of the variable for each of the words
+        '''
+        _check_names(names)
+        words = list(words)
+        return dict((name, variables[name](self, words)) for name in names)
+
+    def rows(self, words, names):
+        '''
+        CSV rows for the words: the word, then the values of the variables
+        (empty for NaN)
+        '''
+        values = self.compute(words, names)
+        return [[word] + [_format(values[name][i]) for name in names]
+                for i, word in enumerate(words)]
+
+    def iter_chunks(self, words, names, processes=None, chunk_size=1000):
+        '''
+        Returns an iterator over the rows of the table, in order, as lists
+        of up to chunk_size rows. If processes is not 1, the chunks are
+        computed by a pool of that many processes (by default, one per
+        core), forked after the lexicons are loaded.
+        '''
+        words = list(words)
+        # Load all of the lexicons and indexes that the variables use before
+        # forking (this also checks the variable names)
+        self.prepare(names)
+        chunks = [words[i:i + chunk_size]
+                  for i in range(0, len(words), chunk_size)]
+        if processes == 1 or len(chunks) <= 1:
+            return (self.rows(chunk, names) for chunk in chunks)
+        return self._pool_chunks(chunks, names, processes)
+
+    def _pool_chunks(self, chunks, names, processes):
+        global _worker_table
+        self.freeze()
+        _worker_table = self
+        pool = multiprocessing.Pool(processes)
+        try:
+            # Only the words are sent to the workers, which use the copy of
+            # the table that they inherited
+            for rows in pool.imap(_rows_job, [(x, names) for x in chunks]):
+                yield rows
+        finally:
+            pool.terminate()
+            _worker_table = None
+
+    def write_csv(self, words, names, output, processes=None,
+                  chunk_size=1000):
+        '''
+        Writes the table to output (a filename or a file object); see
+        iter_chunks for processes and chunk_size
+        '''
+        chunks = self.iter_chunks(words, names, processes, chunk_size)
+        f = open(output, 'wb') if isinstance(output, basestring) else output
+        writer = csv.writer(f)
+        writer.writerow(['word'] + list(names))
+        for rows in chunks:
+            writer.writerows(rows)
+            f.flush()
+        if f is not output:
+            f.close()
+
+
+# The table that the pool workers use (see LexVarsTable._pool_chunks)
+_worker_table = None
+
+
+def _rows_job(args):
+    words, names = args
+    return _worker_table.rows(words, names)
+
+
+def _check_names(names):
+    unknown = set(names) - set(variables)
+    if len(unknown) > 0:
+        raise ValueError('Unknown variables %s (known variables: %s)' %
+                         (sorted(unknown), ', '.join(sorted(variables))))
+
+
+def _format(value):
+    if np.isnan(value):
+        return ''
+    if np.isfinite(value) and value == int(value):
+        return '%d' % value
+    return repr(float(value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compute lexical variables for a list of words')
+    parser.add_argument('words', help='file with one word per line')
+    parser.add_argument('-v', '--variables', required=True,
+                        help='comma-separated variable names: %s' %
+                        ', '.join(sorted(variables)))
+    parser.add_argument('-o', '--output', help='CSV file (default: stdout)')
+    parser.add_argument('--celex', help='CELEX english directory')
+    parser.add_argument('--valex', help='VALEX lexicon directory or CSV file')
+    parser.add_argument('--cds', help='contextual distinctiveness JSON file')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: one per '
+                        'core)')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    words = [x.strip() for x in open(args.words)]
+    words = [x for x in words if x != '']
+    table = LexVarsTable(args.celex, args.valex, args.cds)
+    try:
+        table.write_csv(words, args.variables.split(','),
+                        args.output or sys.stdout, args.processes,
+                        args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,27 @@
 # 2011-2015
 # License: BSD (3-clause)
 
-import bz2
+import bisect
+import collections
 import csv
+import hashlib
 import itertools
-import math
+import json
+import multiprocessing
 import os
 import pickle
-import re
+import StringIO
+import tempfile
+import warnings
 
+import numpy as np
 
-regexp = re.compile(r'#S\(EPATTERN.*?\(VSUBCAT (?P<frame>.*?)\)'
-                    r'.*?CLASSES \((?P<class>\d+) (?P<classfreq>\d+)\)'
-                    r'.*?RELFREQ (?P<relfreq>.*?) :FREQCNT (?P<freqcnt>\d*)',
-                    re.DOTALL)
+import instrument
+from buffers import StringTable, read_pack, shared_pack, write_pack
+from entropy import entropies
+from epattern import iter_frames, iter_records, open_lex
+from similarity import SimilarityIndex
+from subcat import SubcatMatrix
 
 class Valex(object):
     '''
@@ -37,7 +45,13 @@ class Valex(object):
     >> vlx.read_csv(path_to_csv_file)
     '''
 
-    def __init__(self, path, collapse_anlt=False):
+    # CSVs read by read_csv are cached in the format of buffers.py; bump
+    # this when the layout of the arrays changes
+    cache_version = 1
+    default_cache_dir = os.path.expanduser('~/.lexvars_cache')
+
+    def __init__(self, path, collapse_anlt=False, cache_dir=None,
+                 use_cache=True):
         '''
         path: directory where .lex or .lex.bz2 files are located; for example,
             valex_root/release/lexicons/lex-lrec5
@@ -45,55 +59,145 @@ class Valex(object):
         collapse_anlt: if true, use the coarse grained distinctions in ANLT,
             rather than the many distinctions made by VALEX, which 
             distinguishes more than a 100
+
+        cache_dir: directory for the parsed CSVs (default ~/.lexvars_cache,
+            shared with Celex). The cache is keyed by the path, size and
+            modification time of the CSV.
+
+        use_cache: if False, always parse the CSV in read_csv
         '''
-        self.verbs = {}
+        self._verbs = {}
+        # Columns read by read_csv, until verbs is first used
+        self._csv_columns = None
         self.path = path
         self.collapse_anlt = collapse_anlt
+        self.cache_dir = cache_dir or self.default_cache_dir
+        self.use_cache = use_cache
+        self._matrix = None
+        self._similarity_indexes = {}
+
+    @property
+    def verbs(self):
+        '''
+        Dictionary from each verb to its list of frame dictionaries (or a
+        FrozenVerbs, after freeze)
+        '''
+        if self._csv_columns is not None:
+            self._verbs = self._csv_columns.thaw()
+            self._csv_columns = None
+        return self._verbs
+
+    @verbs.setter
+    def verbs(self, verbs):
+        self._verbs = verbs
+        self._csv_columns = None
+
+    def _columns(self):
+        # The verbs as a FrozenVerbs if they are stored as columns (read by
+        # read_csv or frozen), without building the dictionaries
+        if self._csv_columns is not None:
+            return self._csv_columns
+        if isinstance(self._verbs, FrozenVerbs):
+            return self._verbs
+        return None
 
     def entropy(self, verb):
-        result = 0
-        for frame in verb:
-            freq = frame['relfreq']
-            result += -freq * math.log(freq) / math.log(2)
-        return result
-
-    def load_all_verbs(self, progress=True):
-        verb_files = os.listdir(self.path)
-        for i, verb_file in enumerate(verb_files):
-            if progress and i % 500 == 0:
-                print i
-            fname_parts = verb_file.split('.')
-            if fname_parts[-1] in ['bz2', 'lex']:
-                filename = os.path.join(self.path, verb_file)
-                self.verbs[fname_parts[0]] = self.read_lex_file(filename)
+        relfreqs = [frame['relfreq'] for frame in verb]
+        return entropies(relfreqs, [0, len(relfreqs)], normalize=False)[0]
 
-    def read_lex_file(self, filename):
-        _, ext = os.path.splitext(filename) 
-        if ext == '.bz2':
-            s = bz2.BZ2File(filename).read()
-        else:
-            s = open(filename).read()
+    def entropies(self):
+        '''
+        Dictionary from each verb to the entropy of its subcategorization
+        distribution, computed for all of the verbs at once
+        '''
+        columns = self._columns()
+        if columns is not None:
+            relfreqs = columns.column('relfreq')
+            return dict(zip(list(columns), entropies(relfreqs, columns.offsets,
+                                                     normalize=False)))
+        verbs = sorted(self.verbs)
+        offsets = np.zeros(len(verbs) + 1, np.int64)
+        np.cumsum([len(self.verbs[v]) for v in verbs], out=offsets[1:])
+        relfreqs = [frame['relfreq'] for v in verbs for frame in self.verbs[v]]
+        return dict(zip(verbs, entropies(relfreqs, offsets, normalize=False)))
+
+    def subcat_matrix(self):
+        '''
+        The verbs as a SubcatMatrix (see subcat.py), built the first time
+        it is needed after the verbs are loaded
+        '''
+        if self._matrix is None:
+            columns = self._columns()
+            if columns is not None:
+                self._matrix = SubcatMatrix.from_columns(
+                    list(columns), columns.offsets,
+                    list(columns.vocabulary('frame')),
+                    columns.column('frame'), columns.column('relfreq'),
+                    columns.column('freqcnt'))
+            else:
+                self._matrix = SubcatMatrix.from_verbs(self.verbs)
+        return self._matrix
 
-        matches = []
-        for match in regexp.finditer(s):
-            d = match.groupdict()
-            d['freqcnt'] = int(d['freqcnt'])
-            d['relfreq'] = float(d['relfreq'])
-            matches.append(d)
+    def similarity_index(self, metric='js'):
+        '''
+        SimilarityIndex over the distributions of the verbs, for finding the
+        verbs with the most similar distributions by Jensen-Shannon
+        divergence ('js'), Hellinger distance ('hellinger') or cosine
+        distance ('cosine'); built the first time it is needed
+        '''
+        if metric not in self._similarity_indexes:
+            with instrument.phase('valex.similarity_index') as phase:
+                index = SimilarityIndex(self.subcat_matrix(), metric)
+                phase.add('verbs', len(index))
+            self._similarity_indexes[metric] = index
+        return self._similarity_indexes[metric]
+
+    def freeze(self):
+        '''
+        Replaces verbs with a FrozenVerbs, so that worker processes forked
+        afterwards share the frames instead of each getting a copy of the
+        dictionaries (which reference counting would otherwise unshare
+        page by page). verbs is read-only afterwards (see FrozenVerbs).
+        '''
+        columns = self._columns()
+        self.verbs = columns if columns is not None else \
+            FrozenVerbs(self.verbs)
+
+    def load_all_verbs(self, progress=False, processes=1):
+        '''
+        processes, progress: see read_lexicons (the number of files and
+            verbs is also reported to instrument as valex.read_lexicons)
+        '''
+        if isinstance(self.verbs, FrozenVerbs):
+            self.verbs = self.verbs.thaw()
+        self._matrix = None
+        self._similarity_indexes = {}
+        verbs, = read_lexicons([self.path], processes, progress)
+        if self.collapse_anlt:
+            verbs = dict((verb, collapse_frames(frames))
+                         for verb, frames in verbs.items())
+        self.verbs.update(verbs)
+
+    def read_lex_records(self, filename):
+        '''
+        All of the fields of each #S(EPATTERN ...) record in a .lex or
+        .lex.bz2 file, as a list of dictionaries (see epattern.py)
+        '''
+        with instrument.phase('valex.parse') as phase:
+            records = list(iter_records(open_lex(filename)))
+            phase.add('records', len(records))
+        return records
+
+    def read_lex_file(self, filename):
+        with instrument.phase('valex.parse') as phase:
+            matches = list(iter_frames(open_lex(filename)))
+            phase.add('frames', len(matches))
 
         if self.collapse_anlt:
-            collapsed = []
-            key = lambda x: x['frame']
-            matches.sort(key=key)
-            for frame, g in itertools.groupby(matches, key):
-                l = list(g)
-                collapsed.append({'frame': frame,
-                                  'freqcnt': sum(x['freqcnt'] for x in l),
-                                  'relfreq': sum(x['relfreq'] for x in l)})
-            return collapsed
+            return collapse_frames(matches)
         else:
             return matches
-        
+
     def write_csv(self, output_filename):
         f = open(output_filename, 'w')
         writer = csv.writer(f)
@@ -105,23 +209,383 @@ class Valex(object):
         f.close()
 
     def read_csv(self, filename):
-        reader = csv.DictReader(open(filename))
+        '''
+        Reads a CSV written by write_csv. The columns of the file are saved
+        to the cache directory the first time it is read, and mapped from
+        there afterwards. entropies, subcat_matrix and freeze use the
+        columns directly; the frame dictionaries of verbs are only built
+        when verbs is first used.
+        '''
+        self._matrix = None
+        self._similarity_indexes = {}
+        filename = os.path.abspath(filename)
+        cache = None
+        if self.use_cache:
+            cache = self._cache_filename(filename)
+            if os.path.exists(cache):
+                with instrument.phase('valex.cache_read') as phase:
+                    columns = FrozenVerbs.from_arrays(read_pack(cache)[0])
+                    phase.add('rows', len(columns.column('relfreq')))
+                self.verbs = {}
+                self._csv_columns = columns
+                return
+        with instrument.phase('valex.read_csv') as phase:
+            arrays = read_csv_arrays(filename)
+            phase.add('rows', len(arrays['relfreq']))
+        if cache is not None:
+            self._write_cache(cache, arrays)
         self.verbs = {}
-        for row in reader:
-            row['freqcnt'] = int(row['freqcnt'])
-            row['relfreq'] = float(row['relfreq'])
-            dict_entry = self.verbs.setdefault(row.pop('verb'), [])
-            dict_entry.append(row)
+        self._csv_columns = FrozenVerbs.from_arrays(arrays)
+
+    def _cache_filename(self, filename):
+        # valex-<name>-<path>-<fingerprint>.lxv, where path identifies the
+        # directory of the CSV and the fingerprint its current contents
+        path = hashlib.sha1(filename).hexdigest()[:8]
+        return os.path.join(self.cache_dir, 'valex-%s-%s-%s.lxv' % (
+            os.path.basename(filename), path, self.fingerprint(filename)))
+
+    def _write_cache(self, cache, arrays):
+        # Saves the columns of a CSV, and removes the files that were saved
+        # for earlier contents of the same CSV
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            write_pack(cache, arrays, {})
+        except (IOError, OSError) as e:
+            warnings.warn('Could not write VALEX cache: %s' % e)
+            return
+        current = os.path.basename(cache)
+        prefix = current[:current.rindex('-') + 1]
+        for other in os.listdir(self.cache_dir):
+            if other.startswith(prefix) and other.endswith('.lxv') and \
+                    other != current:
+                try:
+                    os.unlink(os.path.join(self.cache_dir, other))
+                except OSError:
+                    pass
+
+    def fingerprint(self, filename):
+        '''
+        Identifies the current contents of a CSV: a hash of the cache
+        format version and the path, size and modification time of the file
+        '''
+        st = os.stat(filename)
+        h = hashlib.sha1('v%d %s %d %r' % (self.cache_version, filename,
+                                           st.st_size, st.st_mtime))
+        return h.hexdigest()[:16]
+
+
+def _intern(field, values):
+    # The values of a string field as an id per value and a sorted string
+    # table of the distinct values, in the layout of FrozenVerbs
+    vocabulary, ids = np.unique(np.array(values, str), return_inverse=True)
+    arrays = {field + '.ids': ids.astype(np.int32)}
+    arrays[field + '.data'], arrays[field + '.offsets'] = StringTable.build(
+        vocabulary.tolist())
+    return arrays
+
+
+def read_csv_arrays(filename):
+    '''
+    The columns of a CSV written by Valex.write_csv, in the layout of
+    FrozenVerbs: the rows are grouped by verb, in sorted order (keeping
+    their order within each verb), the frame and any other string columns
+    are interned, and relfreq and freqcnt are parsed into arrays in bulk.
+    Files without quoted values are split directly; others go through the
+    csv module.
+    '''
+    with open(filename, 'rb') as f:
+        text = f.read()
+    lines = text.splitlines()
+    header = lines[0].split(',') if lines else ['verb']
+    rows = lines[1:]
+    cells = ','.join(rows).split(',') if rows else []
+    if '"' in text or len(cells) != len(rows) * len(header):
+        rows = [row for row in csv.reader(lines[1:]) if row]
+        cells = [cell for row in rows for cell in row]
+        if len(cells) != len(rows) * len(header):
+            raise ValueError('Rows of %s have different numbers of '
+                             'columns' % filename)
+    columns = dict((field, cells[i::len(header)])
+                   for i, field in enumerate(header))
+    names, owners = np.unique(np.array(columns.pop('verb'), str),
+                              return_inverse=True)
+    order = np.argsort(owners, kind='mergesort')
+    arrays = {}
+    arrays['verbs.data'], arrays['verbs.offsets'] = StringTable.build(
+        names.tolist())
+    arrays['frames'] = np.zeros(len(names) + 1, np.int64)
+    np.cumsum(np.bincount(owners, minlength=len(names)),
+              out=arrays['frames'][1:])
+    for field, values in columns.items():
+        values = np.array(values, str)[order]
+        if field in FrozenVerbs.numeric:
+            arrays[field] = values.astype(FrozenVerbs.numeric[field])
+        else:
+            arrays.update(_intern(field, values))
+    return arrays
+
+
+def collapse_frames(frames):
+    '''
+    The coarse grained (ANLT) distribution of a verb given its VALEX
+    frames: the frequencies of the frames with the same name are summed
+    '''
+    collapsed = []
+    key = lambda x: x['frame']
+    for frame, g in itertools.groupby(sorted(frames, key=key), key):
+        l = list(g)
+        collapsed.append({'frame': frame,
+                          'freqcnt': sum(x['freqcnt'] for x in l),
+                          'relfreq': sum(x['relfreq'] for x in l)})
+    return collapsed
+
+
+def _read_lex_job(args):
+    i, verb, filename = args
+    return i, verb, list(iter_frames(open_lex(filename)))
+
+
+def lex_files(path):
+    '''
+    Dictionary from each verb to its .lex or .lex.bz2 file in a lexicon
+    directory
+    '''
+    files = {}
+    for verb_file in os.listdir(path):
+        fname_parts = verb_file.split('.')
+        if fname_parts[-1] in ['bz2', 'lex']:
+            files[fname_parts[0]] = os.path.join(path, verb_file)
+    return files
+
+
+def read_lexicons(paths, processes=None, progress=False, verbs=None):
+    '''
+    Parses the .lex and .lex.bz2 files in each of the lexicon directories
+    in paths, and returns a list with a dictionary from each verb to its
+    (fine grained) frames for each directory. The files of all of the
+    directories are parsed by one pool of processes (by default, one per
+    core; no pool if processes is 1), so the directories are read
+    concurrently.
+
+    verbs: if given, a list with a collection of verbs for each directory;
+        only the files of those verbs are parsed
+
+    progress: if true, print the number of files parsed every 500 files
+    '''
+    jobs = _lex_jobs(paths, verbs)
+    lexicons = [{} for path in paths]
+    with instrument.phase('valex.read_lexicons') as phase:
+        for i, verb, frames in _parse_lex_jobs(jobs, processes, progress):
+            lexicons[i][verb] = frames
+        phase.add('files', len(jobs))
+        phase.add('verbs', sum(len(x) for x in lexicons))
+    return lexicons
+
+
+def _lex_jobs(paths, verbs=None):
+    jobs = []
+    for i, path in enumerate(paths):
+        for verb, filename in sorted(lex_files(path).items()):
+            if verbs is None or verb in verbs[i]:
+                jobs.append((i, verb, filename))
+    return jobs
+
 
+def _parse_lex_jobs(jobs, processes, progress):
+    # Generator over the (i, verb, frames) of each job of _lex_jobs, in the
+    # order in which they are parsed
+    if len(jobs) == 0:
+        return
+    pool = None
+    if processes == 1:
+        results = itertools.imap(_read_lex_job, jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_read_lex_job, jobs, chunksize=32)
+    try:
+        for n, result in enumerate(results):
+            if progress and n % 500 == 0:
+                print n
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
 
-def generate_all_csvs(input_path, output_path):
-    for lexicon in os.listdir(input_path):
-        for collapse in [True, False]:
-            print lexicon, collapse
-            vlx = Valex(os.path.join(input_path, lexicon), collapse)
-            vlx.load_all_verbs()
-            filename = '%s%s.csv' % (lexicon, '_anlt' if collapse else '')
-            vlx.write_csv(os.path.join(output_path, filename))
+
+manifest_name = 'valex_manifest.json'
+manifest_version = 1
+
+
+def _source_fingerprint(filename):
+    st = os.stat(filename)
+    return [os.path.basename(filename), st.st_size, st.st_mtime]
+
+
+def _file_hash(filename):
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _read_csv_rows(filename):
+    # The header and a dictionary from each verb to its rows, as lists of
+    # strings
+    reader = csv.reader(open(filename, 'rb'))
+    header = next(reader)
+    rows = {}
+    for row in reader:
+        if row:
+            rows.setdefault(row[0], []).append(row)
+    return header, rows
+
+
+def _write_csv_rows(filename, header, rows):
+    # Writes the rows (a dictionary from each verb to its rows) sorted by
+    # verb, atomically (see buffers.write_pack), and returns the SHA-1 of
+    # the file
+    buf = StringIO.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for verb in sorted(rows):
+        writer.writerows(rows[verb])
+    data = buf.getvalue()
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        f = os.fdopen(fd, 'wb')
+        f.write(data)
+        f.close()
+        os.chmod(tmp, 0644)
+        os.rename(tmp, filename)
+    except:
+        os.unlink(tmp)
+        raise
+    return hashlib.sha1(data).hexdigest()
+
+
+def _frame_rows(verb, frames):
+    return [[verb, frame['frame'], frame['relfreq'], frame['freqcnt']]
+            for frame in frames]
+
+
+def _write_manifest(filename, manifest):
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    f = os.fdopen(fd, 'w')
+    json.dump(manifest, f, indent=1, sort_keys=True)
+    f.close()
+    os.chmod(tmp, 0644)
+    os.rename(tmp, filename)
+
+
+def generate_all_csvs(input_path, output_path, processes=None,
+                      incremental=True, progress=False):
+    '''
+    Writes the fine grained and ANLT CSV files (see Valex.write_csv) of
+    each lexicon directory in input_path to output_path, with the verbs in
+    sorted order. Each .lex file is parsed once, for both distributions,
+    and the files of all of the lexicons are parsed in parallel (see
+    read_lexicons).
+
+    A manifest in output_path (valex_manifest.json) records the size and
+    modification time of the .lex file of each verb and the SHA-1 of the
+    CSV files written for each lexicon. If incremental is true, only the
+    .lex files that were added or changed since are parsed, and the rows
+    of their verbs are replaced in the existing CSV files (and the rows of
+    verbs whose files were removed are dropped); a lexicon whose CSV files
+    are missing or don't match the manifest is regenerated in full. The
+    CSV files of each lexicon are written, and the manifest saved, as soon
+    as all of its files are parsed, so if a run fails, running it again
+    only redoes the lexicons it hadn't finished.
+
+    progress: if true, print the number of files parsed so far and what
+        is done with each lexicon
+    '''
+    manifest_file = os.path.join(output_path, manifest_name)
+    manifest = {'version': manifest_version, 'lexicons': {}}
+    if incremental and os.path.exists(manifest_file):
+        saved = json.load(open(manifest_file))
+        if saved.get('version') == manifest_version:
+            manifest = saved
+    lexicons = sorted(x for x in os.listdir(input_path)
+                      if os.path.isdir(os.path.join(input_path, x)))
+    paths = [os.path.join(input_path, x) for x in lexicons]
+
+    # Find the verbs to parse in each lexicon
+    plans = []
+    for lexicon, path in zip(lexicons, paths):
+        sources = dict((verb, _source_fingerprint(filename))
+                       for verb, filename in lex_files(path).items())
+        entry = manifest['lexicons'].get(lexicon)
+        full = entry is None or any(
+            _file_hash(os.path.join(output_path, name)) != recorded
+            for name, recorded in sorted(entry['outputs'].items()))
+        old = {} if full else entry['sources']
+        changed = set(verb for verb, fingerprint in sources.items()
+                      if old.get(verb) != fingerprint)
+        removed = set(old) - set(sources)
+        plans.append((full, sources, changed, removed))
+
+    def update(i, verbs):
+        full, sources, changed, removed = plans[i]
+        if not full and not changed and not removed:
+            if progress:
+                print lexicons[i], 'up to date'
+            return
+        if progress:
+            print lexicons[i], 'regenerating' if full else \
+                '%d changed, %d removed' % (len(changed), len(removed))
+        outputs = _update_csvs(output_path, lexicons[i], full, verbs,
+                               removed)
+        manifest['lexicons'][lexicons[i]] = {'sources': sources,
+                                             'outputs': outputs}
+        _write_manifest(manifest_file, manifest)
+
+    jobs = _lex_jobs(paths, [changed for _, _, changed, _ in plans])
+    remaining = [len(changed) for _, _, changed, _ in plans]
+    parsed = [{} for path in paths]
+    for i in range(len(lexicons)):
+        if remaining[i] == 0:
+            update(i, {})
+    results = _parse_lex_jobs(jobs, processes, progress)
+    try:
+        with instrument.phase('valex.read_lexicons') as phase:
+            for i, verb, frames in results:
+                parsed[i][verb] = frames
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    update(i, parsed[i])
+                    parsed[i] = None
+            phase.add('files', len(jobs))
+    finally:
+        results.close()
+
+
+def _update_csvs(output_path, lexicon, full, verbs, removed):
+    # Writes the CSV files of a lexicon, replacing the rows of the verbs
+    # (a dictionary from each verb to its frames) and dropping the removed
+    # verbs from the existing files unless full, and returns a dictionary
+    # from each file name to its SHA-1
+    outputs = {}
+    for collapse in [True, False]:
+        filename = '%s%s.csv' % (lexicon, '_anlt' if collapse else '')
+        header = ['verb', 'frame', 'relfreq', 'freqcnt']
+        rows = {}
+        if not full:
+            header, rows = _read_csv_rows(os.path.join(output_path, filename))
+        for verb in removed:
+            rows.pop(verb, None)
+        for verb, frames in verbs.items():
+            if collapse:
+                frames = collapse_frames(frames)
+            rows[verb] = _frame_rows(verb, frames)
+            if not rows[verb]:
+                del rows[verb]
+        outputs[filename] = _write_csv_rows(
+            os.path.join(output_path, filename), header, rows)
+    return outputs
 
 
 class ValexRelativeEntropy(object):
@@ -144,39 +608,177 @@ class ValexRelativeEntropy(object):
     0.569
     '''
 
-    CELEX_VERB = '4'
-
     def __init__(self, clx, vlx):
         self.clx = clx
         self.vlx = vlx
 
     def build_reference_distribution(self):
-        counts = {}
-        self.clx.load_lemmas()
-        for verb, frames in self.vlx.verbs.items():
-            lemmas = self.clx._lemma_lookup.get(verb)
-            if lemmas is None:
-                continue
-            relevant_lemmas = [x for x in lemmas if
-                               x['ClassNum'] == self.CELEX_VERB]
-            freq = sum(int(x['CobMln']) for x in relevant_lemmas)
-            for frame in frames:
-                current = counts.get(frame['frame'], 0)
-                counts[frame['frame']] = current + freq * frame['relfreq']
-
-        total = float(sum(counts.values()))
-        self.reference = {}
-        for frame, count in counts.items():
-            self.reference[frame] = count / total
+        # The weight of each verb is the CobMln frequency of its CELEX verb
+        # lemmas; verbs that aren't in CELEX don't contribute any frames
+        # to the reference distribution
+        matrix = self.vlx.subcat_matrix()
+        ids, owners = self.clx.lemma_ids_many(list(matrix.verbs))
+        cob = self.clx.lemma_array('CobMln')[ids]
+        is_verb = self.clx.lemma_array('ClassNum')[ids] == \
+            self.clx.class_num('verb')
+        n = len(matrix.verbs)
+        weights = np.bincount(owners, cob * is_verb, minlength=n)
+        found = np.bincount(owners, minlength=n) > 0
+        self.reference_array = matrix.weighted_average(weights)
+        self.in_reference = matrix.relfreq[found].getnnz(axis=0) > 0
+        self.reference = dict(zip(matrix.frames[self.in_reference].tolist(),
+                                  self.reference_array[self.in_reference]))
 
     def calculate_relative_entropies(self):
-        self.relative_entropies = {}
-        for verb, verb_frames in self.vlx.verbs.items():
-            self.relative_entropies[verb] = 0
-            for frame, reference_prob in self.reference.items():
-                results = [x for x in verb_frames if x['frame'] == frame]
-                verb_prob = (0 if len(results) == 0 else
-                                  results[0]['relfreq'])
-                if verb_prob > 0:
-                    ratio = math.log(verb_prob / reference_prob) / math.log(2) 
-                    self.relative_entropies[verb] += verb_prob * ratio
+        matrix = self.vlx.subcat_matrix()
+        divergences = matrix.kl_divergences(self.reference_array,
+                                            self.in_reference)
+        self.relative_entropies = dict(zip(matrix.verbs.tolist(), divergences))
+
+
+class FrozenFrame(collections.Mapping):
+    '''
+    Read-only frame dictionary (see FrozenVerbs)
+    '''
+
+    def __init__(self, frame):
+        self._frame = frame
+
+    def __getitem__(self, field):
+        return self._frame[field]
+
+    def __iter__(self):
+        return iter(self._frame)
+
+    def __len__(self):
+        return len(self._frame)
+
+    def __repr__(self):
+        return repr(self._frame)
+
+
+class FrozenVerbs(collections.Mapping):
+    '''
+    Read-only replacement for Valex.verbs (a dictionary from each verb to
+    its list of frame dicts) that keeps all of the frames in a few flat
+    arrays: the verbs in a sorted string table, the offsets of the frames
+    of each verb, the interned values of each string field (an id per frame
+    and a sorted string table of the distinct values), and arrays for
+    relfreq and freqcnt. The arrays are either in anonymous shared memory
+    or mapped from a cache file, so processes forked after it is built
+    share their pages.
+
+    The frames of a verb are built on access, as a tuple of FrozenFrame
+    (read-only mappings that compare equal to the frame dictionaries), so
+    that changing them fails instead of changing a copy. thaw returns a
+    modifiable copy in the format of Valex.verbs.
+    '''
+
+    numeric = {'relfreq': np.float64, 'freqcnt': np.int64}
+
+    def __init__(self, verbs):
+        names = sorted(verbs)
+        frames = [frame for verb in names for frame in verbs[verb]]
+        fields = sorted(frames[0]) if frames else []
+        arrays = {}
+        arrays['verbs.data'], arrays['verbs.offsets'] = StringTable.build(
+            names)
+        arrays['frames'] = np.zeros(len(names) + 1, np.int64)
+        np.cumsum([len(verbs[verb]) for verb in names],
+                  out=arrays['frames'][1:])
+        for field in fields:
+            values = [frame[field] for frame in frames]
+            if field in self.numeric:
+                arrays[field] = np.array(values, self.numeric[field])
+            else:
+                arrays.update(_intern(field, values))
+        arrays, _ = shared_pack(arrays, {})
+        self._attach(arrays)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        A FrozenVerbs that uses arrays in the layout built by __init__ (and
+        by read_csv_arrays) as they are, without copying them
+        '''
+        verbs = cls.__new__(cls)
+        verbs._attach(arrays)
+        return verbs
+
+    def _attach(self, arrays):
+        self.arrays = arrays
+        self.fields = sorted(name.rsplit('.', 1)[0] for name in arrays
+                             if name in self.numeric or
+                             name.endswith('.ids'))
+        self._verbs = StringTable(arrays['verbs.data'],
+                                  arrays['verbs.offsets'])
+        self.offsets = arrays['frames']
+        self._columns = {}
+        for field in self.fields:
+            if field in self.numeric:
+                self._columns[field] = arrays[field]
+            else:
+                self._columns[field] = (arrays[field + '.ids'],
+                                        self.vocabulary(field))
+
+    def vocabulary(self, field):
+        '''
+        The distinct values of a string field (e.g. frame), sorted; the
+        values of the frames are stored as indices into this table
+        '''
+        return StringTable(self.arrays[field + '.data'],
+                           self.arrays[field + '.offsets'])
+
+    def column(self, field):
+        '''
+        Array of the values of a field for all of the frames of all of the
+        verbs, in order (the frames of verb i are offsets[i]:offsets[i + 1]);
+        interned ids for string fields
+        '''
+        if field in self.numeric:
+            return self._columns[field]
+        return self._columns[field][0]
+
+    def _find(self, verb):
+        i = bisect.bisect_left(self._verbs, verb)
+        if i == len(self._verbs) or self._verbs[i] != verb:
+            raise KeyError(verb)
+        return i
+
+    def _frame(self, j):
+        frame = {}
+        for field in self.fields:
+            if field in self.numeric:
+                frame[field] = self._columns[field][j].item()
+            else:
+                ids, vocabulary = self._columns[field]
+                frame[field] = vocabulary[ids[j]]
+        return frame
+
+    def __getitem__(self, verb):
+        i = self._find(verb)
+        return tuple(FrozenFrame(self._frame(j))
+                     for j in xrange(self.offsets[i], self.offsets[i + 1]))
+
+    def thaw(self):
+        '''
+        Modifiable copy: a dictionary from each verb to its list of frame
+        dictionaries
+        '''
+        offsets = self.offsets.tolist()
+        return dict((verb, [self._frame(j)
+                            for j in xrange(offsets[i], offsets[i + 1])])
+                    for i, verb in enumerate(self._verbs))
+
+    def __contains__(self, verb):
+        try:
+            self._find(verb)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self._verbs)
+
+    def __len__(self):
+        return len(self._verbs)